@@ -0,0 +1,161 @@
+"""
+The kinds of rooms that can be generated, loaded from Data/Rooms/archetypes.json
+Each kind has a weight, a description, link chances, name templates, colour ranges and items it can contain
+Weighted choices are compiled into alias tables, so picking a kind of room or an item takes the same time
+however many of them there are
+"""
+
+import json
+import os
+from random import Random
+from typing import List, Dict, Tuple, Optional, Sequence, Any
+from chunk import link_bits
+from item import Item
+import names
+
+# relative to this file rather than the working directory, so every process generates the same rooms
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'Rooms', 'archetypes.json')
+
+
+class AliasTable:
+    """
+    Chooses from weighted values with one random number, using Vose's alias method
+    Each of the n columns holds its own value with probability prob[i], and its alias otherwise
+    """
+
+    def __init__(self, values: Sequence[Any], weights: Sequence[float]):
+        if not values or len(values) != len(weights) or sum(weights) <= 0 or min(weights) < 0:
+            raise ValueError('AliasTable needs one non-negative weight for each value, and a positive total')
+        self.values = list(values)
+        self.n = n = len(values)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] += scaled[s] - 1
+            (small if scaled[l] < 1 else large).append(l)
+
+    # the integer part of the random number picks a column and the fractional part picks the value or its alias
+    def sample(self, rng: Random):
+        u = rng.random() * self.n
+        i = int(u)
+        return self.values[i] if u - i < self.prob[i] else self.values[self.alias[i]]
+
+    def sample_many(self, rng: Random, count: int) -> list:
+        random, n, prob, alias, values = rng.random, self.n, self.prob, self.alias, self.values
+        out = []
+        for _ in range(count):
+            u = random() * n
+            i = int(u)
+            out.append(values[i] if u - i < prob[i] else values[alias[i]])
+        return out
+
+
+class Archetype:
+    """
+    One kind of room
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.kind: str = data['kind']
+        self.weight: float = data.get('weight', 1)
+        self.description: str = data.get('description', 'An ordinary room')
+        self.templates = names.compile_templates(data.get('templates', []))  # the default templates if empty
+        self.link_chances: List[Tuple[int, float]] = [(link_bits[d], p) for d, p in data.get('links', {}).items()]
+        self.colors: List[Tuple[int, int]] = [tuple(c) for c in data.get('colors', [[0, 200]] * 3)]
+        self.item_chance: float = data.get('item_chance', 0)
+        items = data.get('items', {})
+        self.items = AliasTable(list(items), list(items.values())) if items else None
+
+
+# (name, description, (r, g, b), link mask, item name) for a room
+RoomData = Tuple[str, str, Tuple[int, int, int], int, Optional[str]]
+
+
+class ArchetypeTable:
+    """
+    All the kinds of rooms and the items they can contain
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.archetypes = [Archetype(a) for a in data['archetypes']]
+        self.table = AliasTable(self.archetypes, [a.weight for a in self.archetypes])
+        self.items: Dict[str, Dict[str, Any]] = data.get('items', {})
+
+    @staticmethod
+    def load(path: str = DATA_PATH) -> 'ArchetypeTable':
+        with open(path, 'r') as f:
+            return ArchetypeTable(json.load(f))
+
+    # generate count rooms, all the rooms of each kind are named in one batch
+    # link_chance replaces the link chances of every kind if it is given, link_scales multiplies them for each room
+    def generate(self, rng: Random, count: int, link_chance: Optional[float] = None,
+                 link_scales: Optional[Sequence[float]] = None) -> List[RoomData]:
+        kinds = self.table.sample_many(rng, count)
+
+        groups: Dict[Archetype, List[int]] = {}
+        for i, archetype in enumerate(kinds):
+            groups.setdefault(archetype, []).append(i)
+        room_names: List[Optional[str]] = [None] * count
+        for archetype, indices in groups.items():
+            for i, name in zip(indices, names.random_names(rng, len(indices), archetype.templates)):
+                room_names[i] = name
+
+        random = rng.random
+        rooms = []
+        for i, (archetype, name) in enumerate(zip(kinds, room_names)):
+            color = tuple(lo + int(random() * (hi - lo + 1)) for lo, hi in archetype.colors)
+            scale = 1 if link_scales is None else link_scales[i]
+            links = 0
+            for bit, chance in archetype.link_chances:
+                if random() < (chance if link_chance is None else link_chance) * scale:
+                    links |= bit
+            item = None
+            if archetype.items is not None and random() < archetype.item_chance:
+                item = archetype.items.sample(rng)
+            rooms.append((name, archetype.description, color, links, item))
+        return rooms
+
+    # a room of the given kind with no item, or of the first kind if there isn't one with that name
+    # the room has no links unless links is True
+    def generate_kind(self, rng: Random, kind: str, links: bool = False) -> RoomData:
+        archetype = next((a for a in self.archetypes if a.kind == kind), self.archetypes[0])
+        name = names.random_names(rng, 1, archetype.templates)[0]
+        color = tuple(lo + int(rng.random() * (hi - lo + 1)) for lo, hi in archetype.colors)
+        mask = 0
+        if links:
+            for bit, chance in archetype.link_chances:
+                if rng.random() < chance:
+                    mask |= bit
+        return name, archetype.description, color, mask, None
+
+    # create an item from its name, items that aren't in the data any more are still created
+    def item(self, name: Optional[str]) -> Optional[Item]:
+        if name is None:
+            return None
+        data = self.items.get(name, {})
+        return Item(name, data.get('description', 'Item'), dict(data.get('effects', {})))
+
+
+tables: List[ArchetypeTable] = []
+
+
+# the table loaded from DATA_PATH, loaded the first time it is needed
+def default_table() -> ArchetypeTable:
+    if not tables:
+        tables.append(ArchetypeTable.load())
+    return tables[0]
+
+
+# Test code
+if __name__ == "__main__":
+    r = Random()
+    for room in default_table().generate(r, 10):
+        print(room)
@@ -0,0 +1,217 @@
+"""
+Benchmarks for the parts of the game that need to scale to very large maps
+Run with `python benchmark.py [name ...]`, all benchmarks are run if no names are given
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from random import Random
+from chunk import chunk_positions
+from room import Room
+import names
+import archetypes
+import biome
+import worldgen
+from map import Map
+from player import Player
+
+
+# average memory used by each generated room, not counting the map that holds them
+def room_memory(count: int = 100000):
+    cells = []
+    cx = 0
+    while len(cells) < count:
+        key = (cx, 0)
+        cells.extend((pos, cell) for pos, cell in zip(chunk_positions(key), worldgen.generate_chunk(1, key))
+                     if cell is not None)
+        cx += 1
+    cells = cells[:count]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    t = time.perf_counter()
+    rooms = [Room(name, description, coords=(x, y), color=color, links=worldgen.unmask(links))
+             for (x, y), (name, description, color, links, item) in cells]
+    elapsed = time.perf_counter() - t
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    print('room_memory: %d rooms, %.1f bytes per room, created in %.3fs' % (len(rooms), used / len(rooms), elapsed))
+
+
+# generating names one at a time and in batches, and generating whole chunks
+def name_generation(count: int = 100000):
+    t = time.perf_counter()
+    names.word_list()
+    print('name_generation: word list loaded in %.4fs' % (time.perf_counter() - t))
+    t = time.perf_counter()
+    names.place_model()
+    print('name_generation: place name model loaded in %.4fs' % (time.perf_counter() - t))
+
+    rng = Random(1)
+    t = time.perf_counter()
+    for _ in range(count):
+        Room.random_name(rng)
+    print('name_generation: %d names one at a time in %.3fs' % (count, time.perf_counter() - t))
+
+    t = time.perf_counter()
+    names.random_names(Random(1), count)
+    print('name_generation: %d names in one batch in %.3fs' % (count, time.perf_counter() - t))
+
+    t = time.perf_counter()
+    for cx in range(count // 40):  # about 40 rooms per chunk
+        worldgen.generate_chunk(1, (cx, 0))
+    print('name_generation: %d chunks generated in %.3fs' % (count // 40, time.perf_counter() - t))
+
+
+# sampling rooms from the alias tables takes the same time however many kinds of room there are
+def room_archetypes(count: int = 100000):
+    table = archetypes.default_table()
+    t = time.perf_counter()
+    table.generate(Random(1), count)
+    print('room_archetypes: %d rooms from %d kinds in %.3fs' % (count, len(table.archetypes), time.perf_counter() - t))
+
+    for kinds in (10, 1000):
+        data = {'archetypes': [{'kind': str(i), 'weight': i + 1, 'templates': ['1 of 2'],
+                                'links': {'s': 0.7, 'e': 0.7}, 'item_chance': 0.1, 'items': {'Coin': 1}}
+                               for i in range(kinds)]}
+        table = archetypes.ArchetypeTable(data)
+        t = time.perf_counter()
+        table.table.sample_many(Random(1), count)
+        sampled = time.perf_counter() - t
+        t = time.perf_counter()
+        table.generate(Random(1), count)
+        print('room_archetypes: %d kinds, sampled %d in %.3fs, generated in %.3fs'
+              % (kinds, count, sampled, time.perf_counter() - t))
+
+
+# evaluating the biome noise for a 64x64 area in one go, compared to calculating each cell on its own
+def biome_noise(size: int = 64):
+    field = biome.NoiseField(1, 40)
+    t = time.perf_counter()
+    field.area(0, 0, size, size)
+    batched = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for y in range(size):
+        for x in range(size):
+            field.value(x, y)
+    print('biome_noise: %dx%d area in %.4fs, or %.3fs one cell at a time' % (size, size, batched,
+                                                                            time.perf_counter() - t))
+
+    t = time.perf_counter()
+    f = biome.BiomeField(1)
+    for cy in range(32):
+        for cx in range(32):
+            f.room_chances((cx, cy), 0.6)
+    print('biome_noise: fields for 32x32 chunks in %.3fs' % (time.perf_counter() - t))
+
+
+# generating a large area with routes into every chunk, then asking which rooms can be reached from the first
+# room, compared to a breadth first search over the links
+def connectivity(distance: int = 100, queries: int = 10000):
+    m = Map(1)
+    t = time.perf_counter()
+    m.generate(distance)
+    print('connectivity: %d chunks generated in %.3fs' % (len(m.map.chunks), time.perf_counter() - t))
+
+    rng = Random(1)
+    positions = [(rng.randrange(-distance, distance), rng.randrange(-distance, distance)) for _ in range(queries)]
+    t = time.perf_counter()
+    reachable = sum(m.reachable(pos, (0, 0)) for pos in positions)
+    elapsed = time.perf_counter() - t
+
+    t = time.perf_counter()
+    seen, queue = {(0, 0)}, [(0, 0)]
+    for x, y in queue:
+        for d, (dx, dy) in {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}.items():
+            adj = m.get(x+dx, y+dy)
+            if m.get(x, y).has_link(d) and (x+dx, y+dy) not in seen and adj is not None and not adj.empty():
+                seen.add((x+dx, y+dy))
+                queue.append((x+dx, y+dy))
+    print('connectivity: %d of %d positions reachable, %d queries in %.4fs, one search takes %.3fs'
+          % (reachable, queries, queries, elapsed, time.perf_counter() - t))
+    print('connectivity: %d rooms reachable, %d found by the search' % (m.component_size((0, 0)), len(seen)))
+
+
+# redrawing the map view and minimap after wandering around. From scratch with the room and corridor surfaces
+# made each time (a cache that holds nothing) and taken from the sprite cache, and from the tiles
+# then the frames of the move animation, which only put the tiles together
+def map_drawing(moves: int = 500, draws: int = 200):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from pygame.math import Vector2
+    from map_renderer import MapRenderer, SpriteCache
+    pygame.display.init()
+    pygame.display.set_mode((100, 100))
+
+    m = Map(1)
+    player = Player(m)
+    rng = Random(1)
+    for _ in range(moves):
+        player.move(rng.choice('nesw'))
+
+    for name, cache in (('from scratch, uncached', SpriteCache(0)), ('from scratch, cached', SpriteCache()),
+                        ('from tiles', SpriteCache())):
+        renderer = MapRenderer(m)
+        renderer.sprites = cache
+        t = time.perf_counter()
+        for _ in range(draws):
+            if name == 'from tiles':
+                renderer.draw()
+            else:
+                renderer.draw_area()
+                renderer.draw_area(renderer.mm_radius, renderer.mm_scale, surf=renderer.minimap,
+                                   surfsize=renderer.mm_size)
+                renderer.window.blit(renderer.surface, (0, 0))
+        elapsed = time.perf_counter() - t
+        stats = renderer.view.layer.stats() if name == 'from tiles' else cache.stats()
+        print('map_drawing: %s, %d draws in %.3fs (%.2fms each), %s'
+              % (name, draws, elapsed, elapsed / draws * 1000, stats))
+
+    t = time.perf_counter()
+    for i in range(draws):
+        renderer.draw_window(Vector2(-renderer.view.layer.pitch, 0) * (i % 40 + 1) / 40)
+    elapsed = time.perf_counter() - t
+    print('map_drawing: %d animation frames in %.3fs (%.2fms each), %s'
+          % (draws, elapsed, elapsed / draws * 1000, renderer.view.layer.stats()))
+    pygame.display.quit()
+
+
+# the minimap after each move, drawn from its tiles and drawn from scratch like the main view
+def minimap(moves: int = 1000):
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from map_renderer import MapRenderer
+    pygame.display.init()
+    pygame.display.set_mode((100, 100))
+
+    m = Map(1)
+    player = Player(m)
+    renderer = MapRenderer(m)
+    rng = Random(1)
+    tiles = scratch = 0
+    for _ in range(moves):
+        player.move(rng.choice('nesw'))
+        t = time.perf_counter()
+        renderer.mm_view.look_at(m.curr_room.pos)
+        renderer.mm_view.draw(renderer.minimap, renderer.mm_radius)
+        tiles += time.perf_counter() - t
+        t = time.perf_counter()
+        renderer.draw_area(renderer.mm_radius, renderer.mm_scale, surf=renderer.minimap, surfsize=renderer.mm_size)
+        scratch += time.perf_counter() - t
+    print('minimap: %d moves, %.3fms per move from tiles, %.3fms from scratch, %s, %d rooms explored'
+          % (moves, tiles / moves * 1000, scratch / moves * 1000, renderer.mm_view.layer.stats(),
+             sum(len(p) for p in m.explored_rooms().values())))
+    pygame.display.quit()
+
+
+benchmarks = {'room_memory': room_memory, 'name_generation': name_generation, 'room_archetypes': room_archetypes,
+              'biome_noise': biome_noise, 'connectivity': connectivity, 'map_drawing': map_drawing,
+              'minimap': minimap}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
@@ -0,0 +1,132 @@
+"""
+Smooth noise fields over the whole map, so room density, links and colours change gradually from place to place
+instead of being the same everywhere
+"""
+
+import math
+from collections import OrderedDict
+from typing import Dict, Tuple, List
+import numpy as np
+from chunk import CHUNK_SIZE
+
+REGION_SIZE = 8  # width of the area the fields are calculated for at once, in chunks
+
+
+# the smoothing curve of Perlin noise, 6t^5 - 15t^4 + 10t^3
+def fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+class NoiseField:
+    """
+    2D Perlin noise that is evaluated over a whole area at once with numpy
+    The gradient at each corner of the lattice is worked out from a hash of the seed and the corner, so any corner can
+    be looked up without a table and every process gets the same values. value() calculates one point the same way
+    """
+
+    def __init__(self, seed: int, scale: float):
+        self.seed = seed
+        self.scale = scale  # size of a lattice cell, in rooms
+
+    # unit gradient vectors at the lattice corners (ix, iy), as an array of shape ix.shape + (2,)
+    def gradients(self, ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+        with np.errstate(over='ignore'):
+            return self._gradients(ix, iy)
+
+    # splitmix64 of the corner and the seed, numpy's uint64 arithmetic wraps around
+    def _gradients(self, ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+        h = (np.asarray(ix).astype(np.int64).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) ^ \
+            (np.asarray(iy).astype(np.int64).astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F)) ^ \
+            np.uint64(self.seed & 0xFFFFFFFFFFFFFFFF)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h ^= h >> np.uint64(31)
+        angle = (h >> np.uint64(11)).astype(np.float64) * (2 * np.pi / 2 ** 53)
+        return np.stack([np.cos(angle), np.sin(angle)], axis=-1)
+
+    # the noise at the centre of each cell in the area, indexed [y, x], values are roughly between -0.7 and 0.7
+    def area(self, x: int, y: int, w: int, h: int) -> np.ndarray:
+        xs = (np.arange(x, x + w) + 0.5) / self.scale
+        ys = (np.arange(y, y + h) + 0.5) / self.scale
+        px, py = np.meshgrid(xs, ys)
+        ix, iy = np.floor(px).astype(np.int64), np.floor(py).astype(np.int64)
+        values = np.zeros((h, w))
+        for cx in (0, 1):
+            for cy in (0, 1):
+                g = self.gradients(ix + cx, iy + cy)
+                dx, dy = px - (ix + cx), py - (iy + cy)
+                values += fade(1 - np.abs(dx)) * fade(1 - np.abs(dy)) * (g[..., 0] * dx + g[..., 1] * dy)
+        return values
+
+    # the noise at one cell, one corner at a time
+    def value(self, x: int, y: int) -> float:
+        px, py = (x + 0.5) / self.scale, (y + 0.5) / self.scale
+        ix, iy = math.floor(px), math.floor(py)
+        total = 0.0
+        for cx in (0, 1):
+            for cy in (0, 1):
+                gx, gy = self.gradients(np.array(ix + cx), np.array(iy + cy)).tolist()
+                dx, dy = px - (ix + cx), py - (iy + cy)
+                total += fade(1 - abs(dx)) * fade(1 - abs(dy)) * (gx * dx + gy * dy)
+        return total
+
+
+class BiomeField:
+    """
+    The noise fields that change how each chunk is generated
+    Fields are calculated for a region of REGION_SIZE x REGION_SIZE chunks at a time, and the most
+    recently used regions are cached
+    density - added to the chance of a position having a room
+    links - multiplies the chance of a room having each link
+    warmth - shifts room colours towards red (positive) or blue (negative)
+    """
+
+    def __init__(self, seed: int, cache_size: int = 16):
+        self.fields = {'density': NoiseField(seed * 3 + 1, 40),
+                       'links': NoiseField(seed * 3 + 2, 24),
+                       'warmth': NoiseField(seed * 3 + 3, 64)}
+        self.cache_size = cache_size
+        self.cache: Dict[Tuple[int, int], Dict[str, np.ndarray]] = OrderedDict()
+
+    # the values of each field for the cells of a chunk, arrays indexed [y, x]
+    def chunk(self, key: Tuple[int, int]) -> Dict[str, np.ndarray]:
+        region = (key[0] // REGION_SIZE, key[1] // REGION_SIZE)
+        if region in self.cache:
+            self.cache.move_to_end(region)
+        else:
+            size = REGION_SIZE * CHUNK_SIZE
+            self.cache[region] = {name: field.area(region[0] * size, region[1] * size, size, size)
+                                  for name, field in self.fields.items()}
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        x, y = key[0] % REGION_SIZE * CHUNK_SIZE, key[1] % REGION_SIZE * CHUNK_SIZE
+        return {name: values[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE] for name, values in self.cache[region].items()}
+
+    # the chance of each position in a chunk having a room, in the order of chunk_positions()
+    def room_chances(self, key: Tuple[int, int], room_chance: float) -> List[float]:
+        return np.clip(room_chance + self.chunk(key)['density'] * 0.8, 0.05, 0.95).ravel().tolist()
+
+    # how much to multiply the link chances of the room at each position by
+    def link_scales(self, key: Tuple[int, int]) -> List[float]:
+        return np.clip(1 + self.chunk(key)['links'] * 1.2, 0.3, 1.5).ravel().tolist()
+
+    def warmth(self, key: Tuple[int, int]) -> List[float]:
+        return self.chunk(key)['warmth'].ravel().tolist()
+
+
+biomes: Dict[int, BiomeField] = {}
+
+
+# the biome field for a world seed, each process keeps its own
+def field(seed: int) -> BiomeField:
+    if seed not in biomes:
+        biomes[seed] = BiomeField(seed)
+    return biomes[seed]
+
+
+# Test code
+if __name__ == "__main__":
+    f = NoiseField(1, 8)
+    a = f.area(-5, 3, 20, 10)
+    print(max(abs(a[j, i] - f.value(-5 + i, 3 + j)) for i in range(20) for j in range(10)))
@@ -0,0 +1,179 @@
+from itertools import count
+from typing import Dict, Tuple, Optional, List, Iterator, Callable
+import numpy as np
+
+# width and height of each chunk, in rooms
+CHUNK_SIZE = 8
+
+# values of the kind layer
+NONE = 0  # not generated
+EMPTY = 1
+ROOM = 2
+
+# bits of the links layer
+link_bits = {'n': 1, 'e': 2, 's': 4, 'w': 8}
+# stairs lead to the room at the same position on the level above (<) or below (>), they are kept
+# in the links layer too but never need reconciling, as both ends are generated together
+stair_bits = {'<': 16, '>': 32}
+stair_levels = {'<': -1, '>': 1}  # the change in level when taking the stairs
+exit_bits = {**link_bits, **stair_bits}
+
+versions = count(1)  # see Chunk.changed()
+
+
+def chunk_key(x: int, y: int) -> Tuple[int, int]:
+    return x // CHUNK_SIZE, y // CHUNK_SIZE
+
+
+def chunk_index(x: int, y: int) -> int:
+    return (y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE
+
+
+# the links of the middle of an area once each room also links to the rooms that link to it
+# links is the links layer of the area with a border of one room around it
+def both_ways(links: np.ndarray) -> np.ndarray:
+    new = links[1:-1, 1:-1].copy()
+    new |= (links[:-2, 1:-1] & link_bits['s']) >> 2  # room to the north links south
+    new |= (links[1:-1, 2:] & link_bits['w']) >> 2  # room to the east links west
+    new |= (links[2:, 1:-1] & link_bits['n']) << 2  # room to the south links north
+    new |= (links[1:-1, :-2] & link_bits['e']) << 2  # room to the west links east
+    return new
+
+
+# every position in a chunk, in the same order as Chunk.cells
+def chunk_positions(key: Tuple[int, int]) -> Iterator[Tuple[int, int]]:
+    ox, oy = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+    for y in range(oy, oy + CHUNK_SIZE):
+        for x in range(ox, ox + CHUNK_SIZE):
+            yield x, y
+
+
+class Chunk:
+    """
+    Stores the rooms of one CHUNK_SIZE x CHUNK_SIZE square of the map
+    None is used for positions that have not been generated yet
+    The state of the rooms is also kept in numpy arrays (indexed [y, x]) so it can be used in whole-array operations
+    """
+
+    layers = {'kind': np.uint8, 'explored': np.bool_, 'links': np.uint8, 'revealed': np.bool_}
+
+    def __init__(self, key: Tuple[int, int]):
+        self.key = key
+        self.origin = (key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE)
+        self.cells: List[Optional['Room']] = [None] * (CHUNK_SIZE * CHUNK_SIZE)
+        self.count = 0  # number of generated positions
+
+        self.kind = np.zeros((CHUNK_SIZE, CHUNK_SIZE), Chunk.layers['kind'])
+        self.explored = np.zeros((CHUNK_SIZE, CHUNK_SIZE), Chunk.layers['explored'])
+        self.links = np.zeros((CHUNK_SIZE, CHUNK_SIZE), Chunk.layers['links'])
+        # rooms that are explored or linked to an explored room, kept up to date by the Map
+        self.revealed = np.zeros((CHUNK_SIZE, CHUNK_SIZE), Chunk.layers['revealed'])
+        self.version = next(versions)
+
+    # called whenever the layers change, the version numbers are never reused so a chunk that is
+    # paged out and loaded again doesn't look unchanged, see world_renderer.TileLayer
+    def changed(self):
+        self.version = next(versions)
+
+    def get(self, x: int, y: int):
+        return self.cells[chunk_index(x, y)]
+
+    def set(self, x: int, y: int, room):
+        i = chunk_index(x, y)
+        if self.cells[i] is None and room is not None:
+            self.count += 1
+        elif self.cells[i] is not None and room is None:
+            self.count -= 1
+        self.cells[i] = room
+        self.update(x, y)
+
+    # copy the state of the room at (x, y) into the layers
+    def update(self, x: int, y: int):
+        room = self.cells[chunk_index(x, y)]
+        lx, ly = x % CHUNK_SIZE, y % CHUNK_SIZE
+        if room is None or room.empty():
+            self.kind[ly, lx] = NONE if room is None else EMPTY
+            self.explored[ly, lx] = False
+            self.links[ly, lx] = 0
+            self.revealed[ly, lx] = False
+        else:
+            self.kind[ly, lx] = ROOM
+            self.explored[ly, lx] = room.explored()
+            self.links[ly, lx] = room.link_mask()
+        self.changed()
+
+    def positions(self) -> Iterator[Tuple[int, int]]:
+        return chunk_positions(self.key)
+
+    def full(self):
+        return self.count == CHUNK_SIZE * CHUNK_SIZE
+
+
+class ChunkStore:
+    """
+    Sparse storage for the whole map, chunks are only created once a room is placed in them
+    so memory use only depends on how much of the map has been generated
+    """
+
+    def __init__(self):
+        self.chunks: Dict[Tuple[int, int], Chunk] = {}
+        # called with the key of a chunk that isn't in memory, can load it and return it (or return None)
+        self.fault: Optional[Callable[[Tuple[int, int]], Optional[Chunk]]] = None
+
+    def chunk(self, x: int, y: int, create=False) -> Optional[Chunk]:
+        key = chunk_key(x, y)
+        chunk = self.chunks.get(key)
+        if chunk is None and self.fault is not None:
+            chunk = self.fault(key)
+        if chunk is None and create:
+            chunk = self.chunks[key] = Chunk(key)
+        return chunk
+
+    def get(self, x: int, y: int):
+        chunk = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            if self.fault is None:
+                return None
+            chunk = self.fault((x // CHUNK_SIZE, y // CHUNK_SIZE))
+            if chunk is None:
+                return None
+        return chunk.cells[chunk_index(x, y)]
+
+    def set(self, x: int, y: int, room):
+        self.chunk(x, y, create=True).set(x, y, room)
+
+    # copy part of a layer into a new array, areas outside of any chunk are left as 0
+    # chunks that aren't in memory are only loaded if fault is True
+    def window(self, layer: str, x: int, y: int, w: int, h: int, fault=False) -> np.ndarray:
+        arr = np.zeros((h, w), Chunk.layers[layer])
+        (cx0, cy0), (cx1, cy1) = chunk_key(x, y), chunk_key(x + w - 1, y + h - 1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None and fault and self.fault is not None:
+                    chunk = self.fault((cx, cy))
+                if chunk is None:
+                    continue
+                src = getattr(chunk, layer)
+                ox, oy = chunk.origin
+                x0, y0 = max(x, ox), max(y, oy)
+                x1, y1 = min(x + w, ox + CHUNK_SIZE), min(y + h, oy + CHUNK_SIZE)
+                arr[y0-y:y1-y, x0-x:x1-x] = src[y0-oy:y1-oy, x0-ox:x1-ox]
+
+        return arr
+
+    def __contains__(self, pos: Tuple[int, int]):
+        return chunk_key(*pos) in self.chunks
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        return iter(list(self.chunks.values()))
+
+    # iterate over every generated position and the room stored there
+    def items(self):
+        for chunk in self:
+            for pos, room in zip(chunk.positions(), chunk.cells):
+                if room is not None:
+                    yield pos, room
@@ -0,0 +1,113 @@
+"""
+Puts the panels of the window together on the screen, and only sends the parts of the screen that changed to the display
+Each panel remembers where it was last drawn. When a panel is redrawn, the area it covered before and the area it
+covers now are painted again from every panel that overlaps them, and only those rectangles are updated, so a frame
+where nothing changed doesn't touch any pixels
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import pygame
+
+
+class Panel:
+    """
+    A surface that is shown at a fixed position on the screen
+    source is the object that draws the surface, it sets its dirty attribute to True when the surface has changed
+    """
+
+    def __init__(self, surface: Callable[[], pygame.Surface], pos: Tuple[int, int], source=None,
+                 visible: bool = True):
+        self.surface = surface
+        self.pos = pos
+        self.source = source
+        self.visible = visible
+        self.rect: Optional[pygame.Rect] = None  # where it was last drawn
+
+    # True once after the source has redrawn the surface
+    def changed(self) -> bool:
+        if self.source is None or not getattr(self.source, 'dirty', False):
+            return False
+        self.source.dirty = False
+        return True
+
+
+class Compositor:
+    """
+    The panels in the order they are drawn, later panels are drawn over earlier ones
+    """
+
+    def __init__(self, screen: pygame.Surface, background=(0, 0, 0)):
+        self.screen = screen
+        self.background = background
+        self.panels: Dict[str, Panel] = {}
+        self.invalid: List[pygame.Rect] = []
+        self.pixels_pushed = 0  # in the last frame
+        self.total_pixels = 0
+        self.frames = 0
+        self.invalidate_all()
+
+    def add(self, name: str, surface: Callable[[], pygame.Surface], pos: Tuple[int, int], source=None,
+            visible: bool = True):
+        self.panels[name] = Panel(surface, pos, source, visible)
+        if visible:
+            self.invalidate(name)
+
+    def show(self, name: str, visible: bool = True):
+        if self.panels[name].visible != visible:
+            self.panels[name].visible = visible
+            self.invalidate(name)
+
+    # draw a panel again next frame, even if its source hasn't changed
+    def invalidate(self, name: str):
+        panel = self.panels[name]
+        if panel.rect is not None:
+            self.invalid.append(panel.rect)
+        if panel.visible:
+            panel.rect = panel.surface().get_rect(topleft=panel.pos)
+            self.invalid.append(panel.rect)
+        else:
+            panel.rect = None
+
+    # draw the whole screen again next frame
+    def invalidate_all(self):
+        self.invalid.append(self.screen.get_rect())
+
+    # paint the parts of the screen that have changed and send them to the display, returns the rectangles
+    def update(self) -> List[pygame.Rect]:
+        for name, panel in self.panels.items():
+            if panel.changed() and panel.visible:
+                self.invalidate(name)
+
+        rects = self.merge(self.invalid)
+        self.invalid = []
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.fill(self.background, rect)
+            for panel in self.panels.values():
+                if panel.visible and panel.rect is not None and panel.rect.colliderect(rect):
+                    self.screen.blit(panel.surface(), panel.rect)
+        self.screen.set_clip(None)
+
+        if rects:
+            pygame.display.update(rects)
+        self.pixels_pushed = sum(r.w * r.h for r in rects)
+        self.total_pixels += self.pixels_pushed
+        self.frames += 1
+        return rects
+
+    # join rectangles that overlap, so no pixel is painted twice
+    @staticmethod
+    def merge(rects: List[pygame.Rect]) -> List[pygame.Rect]:
+        out: List[pygame.Rect] = []
+        for rect in rects:
+            rect = pygame.Rect(rect)
+            i = rect.collidelist(out)
+            while i != -1:
+                rect.union_ip(out.pop(i))
+                i = rect.collidelist(out)
+            if rect.w > 0 and rect.h > 0:
+                out.append(rect)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {'frames': self.frames, 'pixels_pushed': self.pixels_pushed, 'total_pixels': self.total_pixels}
@@ -0,0 +1,67 @@
+"""
+Keeps track of which rooms are connected to each other by links, using a union-find (disjoint set) structure
+Links are only ever added, so sets only ever join and each update or query takes near-constant time
+"""
+
+from typing import Dict, Hashable
+
+
+class UnionFind:
+    """
+    Disjoint sets of hashable items, joined by size and with path halving
+    Items that haven't been added are each in a set of their own, with a weight of 1
+    An item's weight is how much it adds to the size of its set, see Map.saved_component() for items with other weights
+    """
+
+    def __init__(self):
+        self.parent: Dict[Hashable, Hashable] = {}
+        self.size: Dict[Hashable, int] = {}  # total weight of each set, only kept for the roots
+
+    def __contains__(self, item) -> bool:
+        return item in self.parent
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    # does nothing if the item has already been added
+    def add(self, item, weight: int = 1):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = weight
+
+    # the root of the item's set
+    def find(self, item):
+        parent = self.parent
+        if item not in parent:
+            return item
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    # join the sets of two items, returns False if they were already in the same set
+    def union(self, a, b) -> bool:
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        self.add(a)
+        self.add(b)
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size.pop(b)
+        return True
+
+    def connected(self, a, b) -> bool:
+        return self.find(a) == self.find(b)
+
+    def component_size(self, item) -> int:
+        return self.size.get(self.find(item), 1)
+
+
+# Test code
+if __name__ == "__main__":
+    u = UnionFind()
+    for i in range(0, 10, 2):
+        u.union(i, i + 2)
+    print(u.connected(0, 10), u.connected(0, 1), u.component_size(4), u.component_size(3))
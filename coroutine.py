@@ -1,5 +1,5 @@
 from collections import deque
-from typing import List, Dict, Callable, Type
+from typing import List, Dict, Callable, Type, Optional
 
 
 class Override: pass
@@ -8,6 +8,7 @@ class Halt: pass
 class Allow: pass
 class TextOutput: pass
 class MapAction: pass
+class Generation: pass
 class Cancel: pass
 
 
@@ -118,6 +119,17 @@ class Coroutine:
     def tick(self):
         self.time_remaining -= 1
 
+    # frames until the next coroutine runs, None if there aren't any
+    @classmethod
+    def next_run(cls) -> Optional[int]:
+        return min((max(0, item.time_remaining) for item in cls.active), default=None)
+
+    # count down the delays as if that many frames had passed, used when no frames were drawn while waiting
+    @classmethod
+    def skip(cls, frames: int):
+        for item in cls.active:
+            item.time_remaining -= frames
+
     @classmethod
     def none(cls):
         pass
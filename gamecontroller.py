@@ -3,6 +3,14 @@ from room import Room
 from player import Player
 from map import *
 from input import *
+from pathfinding import PathFinder
+from pregenerator import Pregenerator
+from scheduler import GenerationScheduler
+from save import save_map, load_map, backup_path
+from pager import ChunkPager
+import os
+
+SAVE_PATH = './Data/Saves/world.sav'
 
 
 class GameController:
@@ -14,24 +22,43 @@ class GameController:
     player: Player = None
     map: Map = None
 
-    def __init__(self, rcontroller):
+    def __init__(self, rcontroller, pregenerate: bool = False, time_slice: bool = False, chunk_budget: int = 512):
 
         from main import RunController
         self.rcont: RunController = rcontroller
         self.event_queue = []
-        self.map = Map()
+        self.load_error: Optional[str] = None  # why the save file couldn't be loaded, shown when the game starts
+        self.map = self.load()
         GameController.map = self.map
+        # limit the number of chunks kept in memory
+        self.pager = ChunkPager(self.map, chunk_budget)
+        # generate most of the map a few milliseconds at a time instead
+        self.scheduler = GenerationScheduler(self.map) if time_slice else None
         self.player = Player(self.map)
         GameController.player = self.player
-        self.print(self.player.room)
+        self.pathfinder = PathFinder(self.map)
+        # generate chunks ahead of the player in other processes
+        self.pregenerator = Pregenerator(self.map) if pregenerate else None
+        if self.load_error is None:
+            self.print(self.player.room)
+        else:
+            self.print(self.load_error + '\n\n' + str(self.player.room))
         self.printqueue = deque([])
         # self.map.print_map(2)
 
     def update(self):
+        if self.pregenerator is not None:
+            self.pregenerator.poll()
+        self.pager.poll()
         queue = self.event_queue
         self.event_queue = []
         return queue
 
+    # True if update() has nothing to do until the player does something
+    def idle(self) -> bool:
+        return not self.event_queue and not self.map.dirty and \
+            (self.pregenerator is None or not self.pregenerator.pending)
+
     def event(self, event):
         if event.type() == 'input':
             return self.input_event(event.value())
@@ -77,6 +104,14 @@ class GameController:
             # self.map.print_map(2)
             return [move_ev]
 
+        if inp.type() == 'save':
+            self.save()
+            self.print('Game saved\n' + str(self.player.room))
+            return []
+
+        if inp.type() == 'goto':
+            return self.goto(inp.value())
+
         if inp.type() == 'info':
             if inp.value() == 'roominfo':
                 self.print(self.player.room)
@@ -93,6 +128,42 @@ class GameController:
 
         return []
 
+    # move to the nearest explored room with a matching name, all in one go
+    def goto(self, name):
+        start = self.player.room
+        target = self.pathfinder.find(start.pos, name)
+        path = None if target is None else self.pathfinder.path(start.pos, target)
+        if path is None:
+            self.print('You don\'t know the way to "' + name + '"\n' + str(self.player.room))
+            return []
+
+        for d in path:
+            self.player.move(d)
+
+        self.print('You travel through ' + str(len(path)) + ' rooms\n' + str(self.player.room))
+        return [Event('goto', 'game', start.name + " -> " + self.player.room.name,
+                      p=self.player, path=path, prev_room=start, room=self.player.room)]
+
+    # continue from the save file if there is one
+    # a save that can't be loaded is moved aside instead of being overwritten by the new world
+    def load(self) -> Map:
+        if os.path.isfile(SAVE_PATH):
+            try:
+                return load_map(SAVE_PATH)
+            except ValueError as e:
+                backup = backup_path(SAVE_PATH)
+                os.replace(SAVE_PATH, backup)
+                self.load_error = 'The save file couldn\'t be loaded: ' + str(e) + '\nIt has been moved to ' + \
+                                  backup + ' and a new world has been started.'
+        return Map()
+
+    def save(self):
+        save_map(self.map, SAVE_PATH, self.player.room.pos)
+
+    # the map is saved first, so nothing that goes wrong while stopping the workers can lose it
     def quit(self):
-        pass
+        self.save()
+        if self.pregenerator is not None:
+            self.pregenerator.shutdown()
+        self.pager.close()
 
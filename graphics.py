@@ -8,6 +8,7 @@ from map_renderer import *
 from text_renderer import *
 from infobox_renderer import *
 from coroutine import *
+from compositor import Compositor
 
 
 class Graphics:
@@ -56,10 +57,24 @@ class Graphics:
         self.text_out_params['text_color'] = (50, 50, 50)
         self.textoutput2 = TextInput(**self.text_out_params)
 
+        # the panels of the window, only the ones that have changed are sent to the display each frame
+        # the map and the info box are shown from the first frame after the intro
+        h = self.SCREEN_DIMENSIONS[1]
+        self.compositor = Compositor(self.screen)
+        self.compositor.add('text_box', lambda: self.text_box, (10, h - 56))
+        self.compositor.add('textoutput2', self.textoutput2.get_surface, (20, h - 130), self.textoutput2)
+        self.compositor.add('textoutput1', self.textoutput1.get_surface, (20, h - 90), self.textoutput1)
+        self.compositor.add('textinput', self.textinput.get_surface, (20, h - 47), self.textinput)
+        self.compositor.add('map', self.map.image, (10, 10), self.map, visible=False)
+        self.compositor.add('infobox', self.infobox.image, (626, 10), self.infobox, visible=False)
+        self.compositor.add('output', self.output.image, (10, 426), self.output)
+
         self.arrowspressed = {K_UP: False, K_DOWN: False, K_LEFT: False, K_RIGHT: False}
         self.arrowspressed = {d: False for d in [K_UP, K_DOWN, K_LEFT, K_RIGHT]}
 
         self.clock = pygame.time.Clock()
+        self.fps = 40
+        self.woken = []  # the event that ended sleep(), handled next frame
         self.queue = deque([])
         self.coroutines = deque([])
         self.arrows_enabled = True
@@ -77,7 +92,7 @@ class Graphics:
 
         output = None
 
-        events = pygame.event.get()
+        events = self.events()
 
         if self.textinput.update(events) and Coroutine.input():
             input_text = self.textinput.get_text().lower()
@@ -96,20 +111,9 @@ class Graphics:
                 return Event('start', 'main', 'game_start')
 
         Coroutine.update()
-        self.screen.fill((0, 0, 0))
-
-        self.screen.blit(self.text_box, (10, self.SCREEN_DIMENSIONS[1] - 56))
-        self.screen.blit(self.textoutput2.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 130))
-        self.screen.blit(self.textoutput1.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 90))
-        self.screen.blit(self.textinput.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 47))
-
-        # self.screen.blit(self.map.image(), (10, 10))
-        # self.screen.blit(self.infobox.draw(), (626, 10))
-        self.screen.blit(self.output.image(), (10, 426))
+        self.compositor.update()
 
-        pygame.display.flip()
-
-        self.clock.tick(40)
+        self.clock.tick(self.fps)
 
         return output
 
@@ -119,7 +123,7 @@ class Graphics:
         self.queue.extend(deque(game_events))
 
         output = []
-        events = pygame.event.get()
+        events = self.events()
 
         if self.textinput.update([] if self.await_input or not Coroutine.input() else events):
             input_text = self.textinput.get_text().lower()
@@ -141,7 +145,8 @@ class Graphics:
             if not self.await_input and not arrow_pressed and self.arrows_enabled \
                     and Coroutine.input() and event.type == KEYDOWN\
                     and pygame.key.get_pressed()[event.key]:
-                key_vals = {K_UP: 'north', K_DOWN: 'south', K_LEFT: 'west', K_RIGHT: 'east'}
+                key_vals = {K_UP: 'north', K_DOWN: 'south', K_LEFT: 'west', K_RIGHT: 'east',
+                            K_PAGEUP: 'upstairs', K_PAGEDOWN: 'downstairs'}
                 if event.key in key_vals:
                     ev = Event('input', 'game', key_vals[event.key],
                                text=key_vals[event.key])
@@ -166,6 +171,9 @@ class Graphics:
                 Coroutine(self.map.move_coroutine, 40, delay=0, singular_type=MapAction, end_func=self.map.draw,
                           forbid_input=True, direction=event.get_value('direction'))
 
+            if event.type() == 'goto':
+                self.map.draw()
+
             if event.type() == 'settings':
                 if event.value() == 'arrows':
                     self.arrows_enabled = not self.arrows_enabled
@@ -180,26 +188,44 @@ class Graphics:
                     self.await_input = True
 
         Coroutine.update()
-        self.screen.fill((0, 0, 0))
+        self.infobox.draw()
+        self.compositor.show('map')
+        self.compositor.show('infobox')
+        self.compositor.update()
 
-        self.screen.blit(self.text_box, (10, self.SCREEN_DIMENSIONS[1] - 56))
-        self.screen.blit(self.textoutput2.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 130))
-        self.screen.blit(self.textoutput1.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 90))
-        self.screen.blit(self.textinput.get_surface(), (20, self.SCREEN_DIMENSIONS[1] - 47))
-
-        self.screen.blit(self.map.image(), (10, 10))
-        self.screen.blit(self.infobox.draw(), (626, 10))
-        self.screen.blit(self.output.image(), (10, 426))
-
-        pygame.display.flip()
-
-        self.clock.tick(40)
+        self.clock.tick(self.fps)
 
         return output
 
+    # the events since the last frame
+    def events(self) -> list:
+        events, self.woken = self.woken + pygame.event.get(), []
+        return events
+
+    # wait until there is an event, the cursor blinks or a coroutine is due to run, instead of drawing frames that
+    # would look the same. Returns False straight away if the next frame has something to do
+    def sleep(self) -> bool:
+        if self.woken or self.queue or pygame.event.peek():
+            return False
+        frame_ms = 1000 // self.fps
+        timeout = self.textinput.next_change()
+        frames = Coroutine.next_run()
+        if frames is not None:
+            timeout = frames * frame_ms if timeout is None else min(timeout, frames * frame_ms)
+        if timeout is not None and timeout < frame_ms:
+            return False
+
+        start = pygame.time.get_ticks()
+        event = pygame.event.wait(0 if timeout is None else timeout)
+        if event.type != NOEVENT:
+            self.woken.append(event)
+        if frames is not None:
+            Coroutine.skip(min(frames, (pygame.time.get_ticks() - start) // frame_ms))
+        return True
+
     def draw_surf(self, surf, pos=(0, 0), delay=0):
         self.screen.blit(surf, pos)
-        pygame.display.flip()
+        pygame.display.update(surf.get_rect(topleft=pos))
         pygame.time.delay(delay)
 
     def prev_input(self, text=''):
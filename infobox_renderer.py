@@ -72,6 +72,8 @@ class InfoBoxRenderer:
         self.data = {'health': 'Health: 3', 'inventory': ['Items:', 'Empty', 'Empty', 'Empty'],
                      'room_name': 'Room 4'}
         self.box_arr = self.create_boxes()
+        self.drawn_data = None  # what the boxes show at the moment
+        self.dirty = True  # set when the image is drawn again, see compositor.py
 
         # draw the first frame
         self.draw()
@@ -92,14 +94,17 @@ class InfoBoxRenderer:
     def image(self):
         return self._image
 
+    # the boxes are only drawn again if what they show has changed
     def draw(self, offset=(0, 0), scale=1):
         scale = self.scale * scale
+        self.update()
+        if self.data == self.drawn_data:
+            return self._image
+        self.drawn_data = dict(self.data)
         self.surface.fill('black')
 
         # pos = lambda x, h: (10, 10 + x * (h+6))
 
-        self.update()
-
         for i, (name, text) in enumerate(self.data.items()):
             box = self.box_arr[i]
             if box.lines == 1:
@@ -111,6 +116,7 @@ class InfoBoxRenderer:
                 self.surface.blit(self.draw_multiline(box, text), box.pos)
 
         self._image.blit(self.surface, (self.total_padding, self.total_padding))
+        self.dirty = True
 
         return self._image
 
@@ -136,6 +142,7 @@ class InfoBoxRenderer:
 
     def draw_window(self, offset=(0, 0)):
         self._image.blit(self.surface, (self.total_padding, self.total_padding))
+        self.dirty = True
 
     def update(self):
         self.data['health'] = 'HP: ' + str(self.player.hp)
@@ -23,6 +23,9 @@ add('n', 'north', 'up', 'u')
 add('e', 'east', 'right', 'r')
 add('s', 'south', 'down', 'd')
 add('w', 'west', 'left', 'l', 'a')
+# up and down already mean north and south, so the stairs use other words
+add('<', 'upstairs', 'ascend', 'climb', 'climb up', 'go up')
+add('>', 'downstairs', 'descend', 'climb down', 'go down')
 
 add('wasd')
 add('nesw', 'compass')
@@ -30,16 +33,20 @@ add('arrows', 'arrow keys')
 
 add('roominfo', 'room', 'room info')
 add('help', 'commands')
+add('goto', 'go', 'travel')
+add('save')
 
 inputs = curr_dict
 types = {}
 curr_dict = types
-add('move', 'n', 'e', 's', 'w')
+add('move', 'n', 'e', 's', 'w', '<', '>')
 add('input_settings', 'wasd', 'nesw', 'arrows')
 add('info', 'roominfo', 'help')
+add('goto')
+add('save')
 
 
-direct_types = ['move', 'help', 'info']
+direct_types = ['move', 'help', 'info', 'save']
 
 arrows_on = True
 wasd = False
@@ -49,6 +56,11 @@ class Input:
 
     @staticmethod
     def get_input(text):
+        # commands followed by a room name, e.g. 'goto home'
+        words = text.strip().split(' ', 1)
+        if text not in inputs and len(words) == 2 and types.get(inputs.get(words[0])) == 'goto':
+            return Event('goto', 'game', words[1].strip(), text=text)
+
         if text not in inputs:
             return Event('error', 'game', 'invalid_input', {'command': 'none', 'text': text})
 
@@ -90,6 +102,9 @@ class Input:
         helptext += 'Movement: north, east, south, west'
         helptext += ', WASD' if wasd else ', NESW'
         helptext += ', arrow keys' if arrows_on else ''
+        helptext += '\nStairs: upstairs (<), downstairs (>)'
+        helptext += '\nGo to an explored room: goto <room name>, goto home'
         helptext += '\nInput settings: NESW, WASD, arrows'
+        helptext += '\nSave the game: save (also saved when you quit)'
 
         return helptext
@@ -17,11 +17,14 @@ class RunController:
     # Initialize objects
     def __init__(
             self,
-            show_graphics: bool = True):
+            show_graphics: bool = True,
+            pregenerate: bool = True,  # generate the map ahead of the player in other processes
+            time_slice: bool = False,  # or spread generation over many frames, for slower machines
+            low_power: bool = True):  # wait for input instead of drawing frames while nothing is happening
 
         self.running: bool = True
 
-        self.game = GameController(self)
+        self.game = GameController(self, pregenerate, time_slice)
         RunController.game = self.game
 
         self.gph = Graphics(self, self.game.map, self.game.player)
@@ -30,6 +33,7 @@ class RunController:
         self.game_events: list = []
         self.show_graphics: bool = show_graphics
         self.graphics_events: deque = deque([])
+        self.low_power: bool = low_power
 
     # Update each frame
     def update(self):
@@ -47,6 +51,10 @@ class RunController:
                     # print text output also to the console
                     # print(e.get_value('text') if 'text' in e else e.value())
 
+    # True if the next frame would have nothing to do unless the player does something
+    def idle(self) -> bool:
+        return not self.graphics_events and self.game.idle()
+
     # Begin the game loop
     def run(self):
         # intro screen (or menu?)
@@ -54,10 +62,14 @@ class RunController:
         self.gph.intro_start()
         while out is None:
             out = self.gph.intro_update()
+            if self.low_power and out is None:
+                self.gph.sleep()
 
         # main game loop
         while self.running:
             self.update()
+            if self.low_power and self.running and self.idle():
+                self.gph.sleep()
 
         pygame.quit()
 
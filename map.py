@@ -1,13 +1,20 @@
 from collections import deque
-from typing import List, Optional, Deque
+from typing import List, Optional, Deque, Dict, Set, Any
 from room import *
 from event import *
+from chunk import *
 from pygame.math import Vector2
+import numpy as np
 # from pygame import colordict
 from sys import stdout as out
-from random import random
+from random import randrange
+import worldgen
+import archetypes
+from connectivity import UnionFind
+from save import SaveFile, F_EXPLORED, F_REVEALED
 
 sides = {'n': Vector2(0, -1), 'e': Vector2(1, 0), 's': Vector2(0, 1), 'w': Vector2(-1, 0)}
+STAIRS = stair_bits['<'] | stair_bits['>']
 sides_tuples = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
 opposites = {'n': 's', 'e': 'w', 's': 'n', 'w': 'e'}
 
@@ -30,10 +37,10 @@ def printmap(arr, word_length=10):
 
 class Map:
     """
-    stores all rooms in a 2D list and can return an area of them or generate new rooms
+    stores all rooms in a sparse set of chunks and can return an area of them or generate new rooms
     """
 
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, save_file: Optional[SaveFile] = None):
         Room.map_obj = self
         test = False  # use the test layout - will not work with the current version
 
@@ -53,18 +60,28 @@ class Map:
             self.curr_room = self.first_room
             return
 
-        self.map_radius = 0
-        self.side_length = 0
+        self.seed = randrange(2 ** 32) if seed is None else seed  # the whole map is generated from this
+        self.save_file = save_file  # chunks that aren't in memory are loaded from here when they are needed
         self.room_chance = 0.6
-        self.map: List[List[Optional[Room]]] = []
-        self.create_map()
+        self.archetypes = archetypes.default_table()  # the kinds of rooms and items, see worldgen.py
+        self.pregenerator = None  # set by pregenerator.Pregenerator if chunks are generated in the background
+        self.scheduler = None  # set by scheduler.GenerationScheduler if generation is spread over many frames
+        self.pager = None  # set by pager.ChunkPager to limit how many chunks are kept in memory
+        self.generate_distance = 5
+        self.validate = False  # check the whole map after every update, very slow
+        # changes whenever the explored part of the map changes, used to invalidate cached paths
+        self.explore_version = 0
+        # the level the player is on, each level is a separate map and the other levels are kept in self.levels
+        self.level = 0 if save_file is None else save_file.player_level
+        self.levels: Dict[int, Dict[str, Any]] = {}
+        self.init_level()
+
+        if save_file is None:
+            self.create_map()
+        else:
+            self.load_save()
 
     def create_map(self):
-        self.map_radius = 2
-        self.side_length = self.map_radius * 2 + 1
-        self.map: List[List[Optional[Room]]] = [[None for _ in range(self.side_length)]
-                                                for _ in range(self.side_length)]
-
         self.first_room = Room('Home', 'Like the other rooms, but more brown',
                                coords=(0, 0), color=(130, 80, 50),
                                links={d: True for d in ['n', 's', 'e', 'w']},
@@ -72,69 +89,299 @@ class Map:
         self.curr_room = self.first_room
         self.rooms = [self.first_room]
 
-        self.map[2][2] = self.first_room
+        self.set(0, 0, self.first_room)
         # self.map[2][3] = Room('room 2', coords=(1, 0), links={d: True for d in ['n', 's', 'e', 'w']})  # test room
 
         # Create the rooms surrounding the starting room
         prev_x, prev_y = sides_tuples['w']
         for x, y in sides_tuples.values():
 
-            self.map[y+2][x+2] = \
-                Room('Entrance', 'Self-explanatory',  coords=(x, y), color='white',
-                     links={d: True for d in ['n', 's', 'e', 'w']},
-                     explored=False)
+            self.set(x, y, Room('Entrance', 'Self-explanatory',  coords=(x, y), color='white',
+                                links={d: True for d in ['n', 's', 'e', 'w']},
+                                explored=False))
 
-            self.map[y+prev_y+2][x+prev_x+2] = \
-                Room('Corner', 'You are now exiting',
-                     coords=(x+prev_x, y+prev_y), color='light green',
-                     links={d: True for d in ['n', 's', 'e', 'w']},
-                     explored=False)
+            self.set(x+prev_x, y+prev_y, Room('Corner', 'You are now exiting',
+                                              coords=(x+prev_x, y+prev_y), color='light green',
+                                              links={d: True for d in ['n', 's', 'e', 'w']},
+                                              explored=False))
 
             prev_x, prev_y = x, y
 
-        self.extend_map(3)
+        self.touched.update(chunk_key(x, y) for x in range(-1, 2) for y in range(-1, 2))
         self.generate()
         # self.print_map(explore_all=True)
 
-    def mapper(self):
-        pass
-
-    def check_size(self, radius=10, room: Optional[Room] = None):
-        if room is None:
-            room = self.curr_room
-
-        x, y = room.pos
-
-        if not (self.inrange((x+radius, y+radius)) and self.inrange((x-radius, y-radius))):
-            self.extend_map(self.map_radius, True)
-
-    def extend_map(self, radius, add=False):
-        side = lambda a: a * 2 + 1
+    # continue from a save file, only the chunks around the player are loaded
+    def load_save(self):
+        self.seed = self.save_file.seed
+        self.curr_room = self.get(self.save_file.player_pos)
+        self.first_room = self.get(0, 0) if self.level == 0 else self.curr_room
+        self.rooms = [self.first_room]
+        self.generate()
 
-        if add:
-            diff = radius
-            r = radius + self.map_radius
+    # the parts of the map that each level has its own copy of, see Map.use_level()
+    level_attrs = ('map', 'generated', 'touched', 'dirty', 'new_chunks', 'explored_names', 'saved_explored_read',
+                   'connectivity', 'saved_components', 'paged_components', 'trimmed_size', 'first_room')
+
+    # start the current level with nothing in memory, nothing is read from the save file until it is needed
+    def init_level(self):
+        self.map = ChunkStore()
+        self.map.fault = self.fault_chunk
+        self.generated: Set[Tuple[int, int]] = set()  # keys of the chunks that have been generated
+        # chunks that are different from when they were generated or loaded, so they can't just be dropped
+        self.touched: Set[Tuple[int, int]] = set()
+        # positions where the links may be inconsistent, see Map.reconcile_links()
+        self.dirty: Set[Tuple[int, int]] = set()
+        self.new_chunks: Set[Tuple[int, int]] = set()  # generated since the last reconcile_links(), see ensure_route()
+        # positions of explored rooms by name, rooms are added when they are explored or loaded and stay when their
+        # chunk is paged out, so finding a room never reads the swap file. See Map.explored_rooms()
+        self.explored_names: Dict[str, Set[Tuple[int, int]]] = {}
+        # the explored rooms in the save file are only added the first time they are needed
+        self.saved_explored_read = self.save_file is None
+        # which rooms are linked to each other, see Map.reachable()
+        self.connectivity = UnionFind()
+        # the connected components in the save file, created the first time they are needed, see Map.saved_component()
+        self.saved_components: Dict[int, Any] = {}
+        # for chunks that were paged out after their rooms were in self.connectivity, the item that stands for each
+        # room (an index, see Map.paged_component()) or -1, see Map.trim_connectivity()
+        self.paged_components: Dict[Tuple[int, int], np.ndarray] = {}
+        self.trimmed_size = 0  # the number of items in self.connectivity after it was last trimmed
+        self.first_room: Optional[Room] = None  # every chunk has a route to this room, see Map.ensure_route()
+
+    # make another level the current one, the current level's state is put aside as it is, so switching
+    # doesn't copy or generate anything. Only the current level can load chunks that aren't in memory
+    def use_level(self, level: int):
+        if level == self.level:
+            return
+        self.map.fault = None
+        self.levels[self.level] = {attr: getattr(self, attr) for attr in Map.level_attrs}
+        self.level = level
+        if level in self.levels:
+            for attr, value in self.levels.pop(level).items():
+                setattr(self, attr, value)
+            self.map.fault = self.fault_chunk
         else:
-            r = radius
-            diff = radius - self.map_radius
-
-        side_len = side(r)
-        mapper = lambda a, b: (a + diff, b + diff)
-        arr: List[List[Optional[Room]]] = [[None for _ in range(side_len)] for _ in range(side_len)]
-
-        for y, row in enumerate(self.map):
-            for x, room in enumerate(row):
-                if room:
-                    new_x, new_y = mapper(x, y)
-                    arr[new_y][new_x] = room
-
-        # for row in self.map:
-        #    print(row)
+            self.init_level()
+        self.explore_version += 1
+
+    # every level that has been visited, including the ones in the save file
+    def level_numbers(self) -> List[int]:
+        levels = set(self.levels) | {self.level}
+        if self.save_file is not None:
+            levels.update(self.save_file.levels())
+        return sorted(levels)
+
+    # take the stairs at pos to another level, which is generated around the other end of the stairs
+    # the first time it is visited. Returns the room at the other end
+    def change_level(self, level: int, pos: Tuple[int, int]) -> Room:
+        # the old level is put aside as it is (see ChunkPager.evict()), and the chunks waiting to be generated are
+        # forgotten
+        if self.pager is not None:
+            self.pager.leave_level()
+        if self.scheduler is not None:
+            self.scheduler.queue.clear()
+        if self.pregenerator is not None:
+            self.pregenerator.cancel()
+
+        self.use_level(level)
+        room = self.get(pos)
+        if room is None:
+            self.generate_chunk(chunk_key(*pos))
+            room = self.get(pos)
+        if self.first_room is None:
+            self.first_room = room
+        self.curr_room = room
+        self.generate(room=room)
+        return room
+
+    # called when a chunk that isn't in memory is needed, returns None if it hasn't been generated
+    # chunks are loaded from the pager's swap file or the save file, or generated again if they were dropped
+    def fault_chunk(self, key: Tuple[int, int]) -> Optional[Chunk]:
+        chunk = None
+        cells = None if self.pager is None else self.pager.load(key)
+        if cells is not None:
+            chunk = self.load_chunk(key, cells, self.pager.string, self.pager.color)
+        elif self.save_file is not None and self.save_file.chunk(key, self.level) is not None:
+            cells = self.save_file.chunk(key, self.level)
+            chunk = self.load_chunk(key, cells, self.save_file.string, self.save_file.color)
+            self.join_saved(key, cells)
+        elif key in self.generated:
+            self.merge_chunk(key, worldgen.generate_chunk(self.seed, key, self.room_chance, level=self.level),
+                             check_saved=False)
+            chunk = self.map.chunks[key]
+
+        if chunk is not None:
+            self.join_paged(key)
+            if self.pager is not None:
+                self.pager.faulted(key)
+        return chunk
+
+    # create a chunk from saved cells (see save.CELL), strings and colours are looked up with the given functions
+    def load_chunk(self, key: Tuple[int, int], cells: np.ndarray, string, color) -> Chunk:
+        chunk = self.map.chunks[key] = Chunk(key)
+        self.generated.add(key)
+        for (x, y), cell in zip(chunk.positions(), cells):
+            if cell['kind'] == EMPTY:
+                chunk.set(x, y, Empty())
+            elif cell['kind'] == ROOM:
+                chunk.set(x, y, Room(string(cell['name']), string(cell['description']),
+                                     coords=(x, y), color=color(cell['color']),
+                                     links=worldgen.unmask(int(cell['links'])),
+                                     explored=bool(cell['flags'] & F_EXPLORED),
+                                     item=self.archetypes.item(string(cell['item'] - 1) if cell['item'] else None)))
+        chunk.revealed[:] = (cells['flags'] & F_REVEALED != 0).reshape(CHUNK_SIZE, CHUNK_SIZE)
+        chunk.changed()
+        for (x, y), room in zip(chunk.positions(), chunk.cells):
+            if room is not None:
+                self.connect(x, y, room)
+                if room.explored():
+                    self.explored_names.setdefault(room.name.lower(), set()).add((x, y))
+
+        # the neighbouring chunks might have changed since the chunk was stored, so check the links along the edges
+        ox, oy = chunk.origin
+        for i in range(CHUNK_SIZE):
+            for pos in [(ox + i, oy), (ox + i, oy + CHUNK_SIZE - 1), (ox, oy + i), (ox + CHUNK_SIZE - 1, oy + i)]:
+                self.mark_dirty(pos)
+
+        return chunk
+
+    # rooms loaded from the save file join the component they were in when it was saved
+    def join_saved(self, key: Tuple[int, int], cells: np.ndarray):
+        for pos, kind, component in zip(chunk_positions(key), cells['kind'], cells['component'].tolist()):
+            if kind == ROOM and pos not in self.connectivity:
+                self.connectivity.add(pos, 0)  # already counted in the size of the saved component
+                self.connectivity.union(pos, self.saved_component(component))
+
+    # the item in self.connectivity that stands for all the rooms of a component in the save file
+    # that haven't been loaded yet, its weight is the number of rooms in the component
+    def saved_component(self, i: int):
+        if i not in self.saved_components:
+            self.saved_components[i] = ('saved', i)
+            self.connectivity.add(self.saved_components[i], int(self.save_file.components[i]))
+        return self.saved_components[i]
+
+    # the item in self.connectivity that stands for the rooms of a component in a chunk that has been paged out
+    @staticmethod
+    def paged_component(key: Tuple[int, int], i: int):
+        return 'paged', key, i
+
+    # rooms of a chunk that had been paged out join the components they were in again
+    def join_paged(self, key: Tuple[int, int]):
+        nodes = self.paged_components.pop(key, None)
+        if nodes is None:
+            return
+        for pos, i in zip(chunk_positions(key), nodes.tolist()):
+            if i >= 0:
+                self.connectivity.add(pos, 0)  # already counted in the size of the component
+                self.connectivity.union(pos, Map.paged_component(key, i))
+
+    # replace the rooms of the chunks that aren't in memory in self.connectivity with one item for each component
+    # in each chunk, so it doesn't keep growing as the player explores. Called after chunks are paged out, it only
+    # does anything once there are twice as many items as there were after it was last trimmed
+    def trim_connectivity(self):
+        old = self.connectivity
+        if len(old) <= 2 * max(self.trimmed_size, CHUNK_SIZE * CHUNK_SIZE * len(self.map.chunks)):
+            return
 
-        # printmap(arr)
+        # the saved components are kept as they are, as the save file refers to them
+        keep = set(self.saved_components.values())
+        groups: Dict[Any, List[Any]] = {}  # the items in the new connectivity for each root in the old one
+        paged: Dict[Tuple[int, int], np.ndarray] = {}
+        nodes: Dict[Tuple[Tuple[int, int], Any], int] = {}
+        counts: Dict[Tuple[int, int], int] = {}  # the next index for each chunk
+
+        def paged_node(key, root) -> int:
+            if (key, root) not in nodes:
+                i = counts.get(key, 0)
+                while Map.paged_component(key, i) in keep:  # a saved component can be an old paged one
+                    i += 1
+                nodes[(key, root)], counts[key] = i, i + 1
+                groups.setdefault(root, []).append(Map.paged_component(key, nodes[(key, root)]))
+            return nodes[(key, root)]
+
+        for key, old_nodes in self.paged_components.items():
+            new_nodes = paged[key] = np.full(CHUNK_SIZE * CHUNK_SIZE, -1, np.int32)
+            for i in np.unique(old_nodes[old_nodes >= 0]).tolist():
+                new_nodes[old_nodes == i] = paged_node(key, old.find(Map.paged_component(key, i)))
+
+        for item in list(old.parent):
+            if item in keep:
+                groups.setdefault(old.find(item), []).append(item)
+            elif isinstance(item[0], str):
+                continue  # saved and paged components that nothing refers to any more
+            elif chunk_key(*item) in self.map.chunks:
+                groups.setdefault(old.find(item), []).append(item)
+            else:
+                key = chunk_key(*item)
+                if key not in paged:
+                    paged[key] = np.full(CHUNK_SIZE * CHUNK_SIZE, -1, np.int32)
+                paged[key][chunk_index(*item)] = paged_node(key, old.find(item))
+
+        # the first item of each component carries the size of the whole component
+        self.connectivity = UnionFind()
+        for root, items in groups.items():
+            self.connectivity.add(items[0], old.size[root])
+            for item in items[1:]:
+                self.connectivity.add(item, 0)
+                self.connectivity.union(items[0], item)
+        self.paged_components = paged
+        self.trimmed_size = len(self.connectivity)
+
+    # the item in self.connectivity for the room at pos, rooms in chunks that have been paged out or that are
+    # still only in the save file are represented by their component so they don't have to be loaded
+    def component_node(self, pos: Tuple[int, int]):
+        key = chunk_key(*pos)
+        if pos in self.connectivity or key in self.map.chunks:
+            return pos
+        if key in self.paged_components and self.paged_components[key][chunk_index(*pos)] >= 0:
+            return Map.paged_component(key, int(self.paged_components[key][chunk_index(*pos)]))
+        if self.save_file is None:
+            return pos
+        cells = self.save_file.chunk(key, self.level)
+        if cells is None or cells['kind'][chunk_index(*pos)] != ROOM:
+            return pos
+        return self.saved_component(int(cells['component'][chunk_index(*pos)]))
+
+    # True if there is a route of links between two rooms, explored or not, b is the current room by default
+    # links to chunks that aren't in memory are only known once those chunks have been loaded
+    def reachable(self, a: Tuple[int, int], b: Optional[Tuple[int, int]] = None) -> bool:
+        if b is None:
+            b = self.curr_room.pos
+        return self.connectivity.connected(self.component_node(a), self.component_node(b))
+
+    # the number of rooms that can be reached from a room, including itself
+    def component_size(self, pos: Optional[Tuple[int, int]] = None) -> int:
+        if pos is None:
+            pos = self.curr_room.pos
+        return self.connectivity.component_size(self.component_node(pos))
+
+    # chunks that have been generated but are only stored on disk, as (key, cells, string, color)
+    def stored_chunks(self):
+        swapped = set()
+        if self.pager is not None:
+            for key in self.pager.keys():
+                if key not in self.map.chunks:
+                    swapped.add(key)
+                    yield key, self.pager.load(key), self.pager.string, self.pager.color
+        if self.save_file is not None:
+            for key in self.save_file.keys(self.level):
+                if key not in self.map.chunks and key not in swapped:
+                    yield key, self.save_file.chunk(key, self.level), self.save_file.string, self.save_file.color
+
+    # positions of every explored room on the level by name, the first call reads the save file's table of explored
+    # rooms into the index. The index itself is returned, so it shouldn't be changed
+    def explored_rooms(self) -> Dict[str, Set[Tuple[int, int]]]:
+        if not self.saved_explored_read:
+            self.saved_explored_read = True
+            strings: Dict[int, str] = {}
+            for name, x, y in self.save_file.explored(self.level).tolist():
+                if name not in strings:
+                    strings[name] = self.save_file.string(name)
+                self.explored_names.setdefault(strings[name], set()).add((x, y))
+        return self.explored_names
 
-        self.map_radius = r
-        self.map = arr
+    def mapper(self):
+        pass
 
     def add_room(self, new_room, prev_room, direction):
         if prev_room not in self.rooms:
@@ -184,36 +431,41 @@ class Map:
         return arr
 
     # improved version of Map.get_visible_area_old() - fixes visibilty issues
-    # still very inefficient, but it doesnt matter as the map is relatively small
+    # a room is visible if it is explored or linked to an explored room, this is kept up to date
+    # in the revealed layer so only the visible rooms have to be looked up
     def get_visible_area(self, distance=3, explore_all=False, room=None):
         if room is None:
             room = self.curr_room
 
-        size = distance * 2 + 1
-        full_arr = self.get_area(distance, room)
-
         if explore_all:
-            return full_arr
-
-        arr: List[List[Optional[Room]]] = [[None for _ in range(size)] for _ in range(size)]
+            return self.get_area(distance, room)
 
-        for y, row in enumerate(full_arr):
-            for x, item in enumerate(row):
-
-                if item is None or item.empty():
-                    arr[y][x] = Empty()
+        size = distance * 2 + 1
+        x0, y0 = room.pos[0] - distance, room.pos[1] - distance
+        # chunks in the area that were paged out, or haven't been loaded from the save yet, are loaded
+        kind = self.map.window('kind', x0, y0, size, size, fault=True)
+        revealed = self.map.window('revealed', x0, y0, size, size)
 
-                elif item.explored():
-                    arr[y][x] = item
+        arr: List[List[Optional[Room]]] = [[None for _ in range(size)] for _ in range(size)]
 
-                else:  # if room is adjacent to an explored room
-                    for d in sides:
-                        if item.has_link(d) and item.get_linked_room(d).explored():
-                            arr[y][x] = item
-                            break
+        for y, x in zip(*np.nonzero(kind != ROOM)):
+            arr[y][x] = Empty()
+        for y, x in zip(*np.nonzero(revealed)):
+            arr[y][x] = self.map.get(x0 + x, y0 + y)
 
         return arr
 
+    # work out which rooms are visible in an area from scratch, the returned array does not include the outer border
+    def visible_mask(self, x, y, w, h) -> np.ndarray:
+        explored = self.map.window('explored', x, y, w, h)
+        links = self.map.window('links', x, y, w, h)[1:-1, 1:-1]
+        visible = explored[1:-1, 1:-1].copy()
+        visible |= (links & link_bits['n'] != 0) & explored[:-2, 1:-1]
+        visible |= (links & link_bits['e'] != 0) & explored[1:-1, 2:]
+        visible |= (links & link_bits['s'] != 0) & explored[2:, 1:-1]
+        visible |= (links & link_bits['w'] != 0) & explored[1:-1, :-2]
+        return visible
+
     # returns all the rooms in the area, even if they are not visible
     def get_area(self, distance=3, room=None):
         if room is None:
@@ -256,86 +508,346 @@ class Map:
             print((('---' + ('-' * size)) * (distance * 2 + 1)) + '-')
 
     # randomly generate all rooms within a radius of the player
-    def generate(self, distance=5, room=None, inplace=True, room_chance=None):
+    # whole chunks are generated at a time, and only the chunks that have not been generated yet
+    def generate(self, distance=None, room=None, room_chance=None):
+        if distance is None:
+            distance = self.generate_distance
         if room is None:
             room = self.curr_room
-        if room_chance is None:
-            room_chance = self.room_chance
-
-        self.check_size(distance+2, room)
-
-        start_coords = room.pos
-        size = distance * 2 + 1
-        mapper = lambda a, b: (a + start_coords[0]-distance, b + start_coords[1]-distance)
-        # unused
-        # local = lambda a, b: (a-distance, b-distance)
-        # localr = lambda a, b: (a + distance, b + distance)
 
-        arr = self.get_visible_area(distance, explore_all=True, room=room)
-        # printmap(arr)
+        keys = self.chunks_around(room.pos, distance)
 
-        for y, row in enumerate(arr):
-            for x, item in enumerate(row):
-                if item is None:
-                    if random() > room_chance:
-                        item = Empty()
-                    else:
-                        item, new_links = Room.random()
+        # the scheduler generates the chunks that aren't needed yet over the next few frames
+        if self.scheduler is not None:
+            near = self.chunks_around(room.pos, self.scheduler.immediate)
+            self.scheduler.add(key for key in keys if key not in near)
+            keys = near
 
-                    arr[y][x] = item
-                    if inplace:
-                        x2, y2, = mapper(x, y)
-                        # print(x, y, x2, y2)
-                        if self.get(x2, y2) is None:
-                            self.set(x2, y2, item)
+        new = []
+        for key in keys:
+            if self.pregenerator is None or not self.pregenerator.collect(key):
+                self.generate_chunk(key, room_chance)
+            new.append(key)
 
-        self.update_all_links()
+        self.reconcile_links()
 
         # Uncomment to print the map to the console
-        # printmap(arr)  # prints the local generated array
-
-        # x, y = mapper(0, 0)  # prints the same section from the full map
-        # x, y = x+self.map_radius, y+self.map_radius
-        # printmap([line[x:x+size] for line in self.map[y:y+size]])
-
-        return arr
-
-    def get(self, x: Union[int, Tuple[int, int]], y: Optional[int] = None, local=True):
-        offset = self.map_radius if local else 0
-        mapper = lambda a, b: (a + offset, b + offset)
+        # printmap(self.get_area(distance, room))
+
+        return new
+
+    # keys of the chunks within the distance that haven't been generated
+    def chunks_around(self, pos: Tuple[int, int], distance: int) -> List[Tuple[int, int]]:
+        cx0, cy0 = chunk_key(pos[0]-distance, pos[1]-distance)
+        cx1, cy1 = chunk_key(pos[0]+distance, pos[1]+distance)
+        return [(cx, cy) for cy in range(cy0, cy1+1) for cx in range(cx0, cx1+1) if (cx, cy) not in self.generated]
+
+    # chunks that are waiting to be generated
+    def pending_chunks(self) -> Set[Tuple[int, int]]:
+        pending = set()
+        if self.scheduler is not None:
+            pending.update(self.scheduler.queue)
+        if self.pregenerator is not None:
+            pending.update(self.pregenerator.pending)
+        return pending - self.generated
+
+    # positions in an area that haven't been generated yet but will be soon
+    def pending_mask(self, x, y, w, h) -> np.ndarray:
+        mask = np.zeros((h, w), np.bool_)
+        pending = self.pending_chunks()
+        if not pending:
+            return mask
+
+        (cx0, cy0), (cx1, cy1) = chunk_key(x, y), chunk_key(x + w - 1, y + h - 1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                if (cx, cy) in pending:
+                    x0, y0 = max(x, cx * CHUNK_SIZE), max(y, cy * CHUNK_SIZE)
+                    x1, y1 = min(x + w, (cx + 1) * CHUNK_SIZE), min(y + h, (cy + 1) * CHUNK_SIZE)
+                    mask[y0-y:y1-y, x0-x:x1-x] = True
+
+        return mask & (self.map.window('kind', x, y, w, h) == NONE)
+
+    # the contents of a chunk only depend on the seed and the key, so this always gives the same rooms
+    def generate_chunk(self, key: Tuple[int, int], room_chance=None):
+        if room_chance is None:
+            room_chance = self.room_chance
+        self.merge_chunk(key, worldgen.generate_chunk(self.seed, key, room_chance, level=self.level))
+
+    # add generated rooms to the map, positions that already have a room are left alone
+    def merge_chunk(self, key: Tuple[int, int], cells: List[worldgen.RoomData], check_saved=True):
+        if check_saved and key not in self.map.chunks and self.fault_chunk(key) is not None:
+            return  # the stored chunk is used instead
+        self.generated.add(key)
+        if check_saved:
+            self.new_chunks.add(key)
+        # create the chunk first, otherwise setting the first room would fault it and generate it again
+        chunk = self.map.chunks.get(key)
+        if chunk is None:
+            chunk = self.map.chunks[key] = Chunk(key)
+        for (x, y), cell in zip(chunk_positions(key), cells):
+            room = chunk.get(x, y)
+            if room is not None:
+                # rooms that were placed before the chunk was generated still get its stairs
+                if cell is not None and not room.empty() and cell[3] & ~room.link_mask() & STAIRS:
+                    room.set_link_mask(room.link_mask() | cell[3] & STAIRS)
+                    chunk.update(x, y)
+                continue
+            if cell is None:
+                self.set(x, y, Empty())
+            else:
+                name, description, color, links, item = cell
+                self.set(x, y, Room(name, description, coords=(x, y), color=color,
+                                    links=worldgen.unmask(links), item=self.archetypes.item(item)))
+
+    # remove a chunk from memory, the rooms around it forget their pointers to its rooms
+    def unload_chunk(self, key: Tuple[int, int]):
+        chunk = self.map.chunks.pop(key)
+        for (x, y), room in zip(chunk.positions(), chunk.cells):
+            if room is None or room.empty():
+                continue
+            for d, (dx, dy) in sides_tuples.items():
+                adj = getattr(room, adj_slots[d])
+                if adj is not None and not adj.empty():
+                    setattr(adj, adj_slots[opposites[d]], None)
+                setattr(room, adj_slots[d], None)
+
+    # rooms on other levels are only returned if they are in memory, see Map.use_level()
+    def get(self, x: Union[int, Tuple[int, int]], y: Optional[int] = None, level: Optional[int] = None):
         if y is None:
-            x, y = mapper(*x)
-        else:
-            x, y = mapper(x, y)
-
-        if not self.inrange(x, y, False):
-            return None
-
-        return self.map[y][x]
-
-    def inrange(self, x: Union[int, Tuple[int, int]], y: Optional[int] = None, local=True):
-        offset = self.map_radius if local else 0
-        mapper = lambda a, b: (a + offset, b + offset)
-        length = lambda a: a*2 + 1
+            x, y = x
+        if level is None or level == self.level:
+            return self.map.get(x, y)
+        if level in self.levels:
+            return self.levels[level]['map'].get(x, y)
+        return None
 
+    # True if the position is inside a chunk that has been created
+    def inrange(self, x: Union[int, Tuple[int, int]], y: Optional[int] = None):
         if y is None:
-            x, y = mapper(*x)
-        else:
-            x, y = mapper(x, y)
-
-        if x < 0 or x >= length(self.map_radius) or y < 0 or y >= length(self.map_radius):
-            return False
-        return True
-
-    def set(self, x, y, room: Room, local=True):
-        offset = self.map_radius if local else 0
-        mapper = lambda a, b: (a + offset, b + offset)
-        mapper_b = lambda a, b: (a - offset, b - offset)
-        x, y = mapper(x, y)
-        self.map[y][x] = room.setpos(mapper_b(x, y))
+            x, y = x
+        return (x, y) in self.map
+
+    def set(self, x, y, room: Room):
+        self.map.set(x, y, room.setpos(x, y))
+        self.connect(x, y, room)
+        self.mark_dirty((x, y))
+        if room.explored():
+            self.add_explored(room)
+
+    # point the room and the rooms around it at each other, see Room.adj_slots
+    def connect(self, x, y, room: Room):
+        chunks = self.map.chunks
+        for d, (dx, dy) in sides_tuples.items():
+            chunk = chunks.get(chunk_key(x+dx, y+dy))
+            adj = None if chunk is None else chunk.get(x+dx, y+dy)
+            if not room.empty():
+                setattr(room, adj_slots[d], adj)
+            if adj is not None and not adj.empty():
+                setattr(adj, adj_slots[opposites[d]], room)
+                adj.invalidate()
+
+    # the links of a room and the rooms next to it need to be checked again
+    def mark_dirty(self, pos: Tuple[int, int]):
+        x, y = pos
+        self.dirty.add(pos)
+        for dx, dy in sides_tuples.values():
+            self.dirty.add((x+dx, y+dy))
+
+    # make the links of every room whose neighbourhood has changed consistent
+    # a room is linked in a direction if it or the room next to it has a link to the other
+    def reconcile_links(self):
+        keys = {chunk_key(x, y) for x, y in self.dirty}
+        self.dirty = set()
+
+        for key in keys:
+            chunk = self.map.chunks.get(key)
+            if chunk is None:
+                continue
+            ox, oy = chunk.origin
+            links = self.map.window('links', ox - 1, oy - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+            old = links[1:-1, 1:-1]
+            new = both_ways(links)
+            new[chunk.kind != ROOM] = 0
+
+            for y, x in zip(*np.nonzero(new != old)):
+                chunk.get(ox + x, oy + y).set_link_mask(int(new[y, x]))
+                if chunk.explored[y, x]:
+                    self.explore_version += 1
+            chunk.links[:] = new
+            # rooms are never unexplored or unlinked, so revealed rooms stay revealed even if the
+            # neighbouring chunk that revealed them has been paged out
+            revealed = chunk.revealed | self.visible_mask(ox - 1, oy - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2)
+            if (new != old).any() or (revealed != chunk.revealed).any():
+                chunk.revealed[:] = revealed
+                chunk.changed()
+            self.join_links(chunk)
+
+        # new chunks are processed nearest to the first room first, so they can connect through each other
+        if self.new_chunks and self.first_room is not None:
+            home = chunk_key(*self.first_room.pos)
+            new_chunks, self.new_chunks = self.new_chunks, set()
+            for key in sorted(new_chunks, key=lambda k: (abs(k[0] - home[0]) + abs(k[1] - home[1]), k)):
+                self.ensure_route(key)
+            if self.dirty:
+                self.reconcile_links()
+
+        if self.validate:
+            self.validate_links()
+
+    # join the linked rooms of a chunk in self.connectivity, links across the edges are only joined
+    # if the chunk on the other side is in memory, otherwise they are joined when it is loaded
+    def join_links(self, chunk: Chunk):
+        ox, oy = chunk.origin
+        union = self.connectivity.union
+        links = chunk.links
+        room = self.map.window('kind', ox - 1, oy - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2) == ROOM
+        # pairs inside the chunk are only joined from the west and north rooms, so they aren't joined twice
+        for y, x in zip(*np.nonzero((links & link_bits['e'] != 0) & room[1:-1, 2:])):
+            union((ox + int(x), oy + int(y)), (ox + int(x) + 1, oy + int(y)))
+        for y, x in zip(*np.nonzero((links & link_bits['s'] != 0) & room[2:, 1:-1])):
+            union((ox + int(x), oy + int(y)), (ox + int(x), oy + int(y) + 1))
+        for y in np.nonzero((links[:, 0] & link_bits['w'] != 0) & room[1:-1, 0])[0].tolist():
+            union((ox, oy + y), (ox - 1, oy + y))
+        for x in np.nonzero((links[0] & link_bits['n'] != 0) & room[0, 1:-1])[0].tolist():
+            union((ox + x, oy), (ox + x, oy - 1))
+
+    # make sure a new chunk can be reached from the first room, if none of its rooms can be then the nearest
+    # reachable room within one chunk of it is found, and the rooms on the way are linked
+    # the search prefers the links that are already there, then new links between rooms, and only goes through
+    # empty positions (which are replaced with corridors) if there's no other way
+    def ensure_route(self, key: Tuple[int, int]):
+        # the chunk might have been paged out before its route was made
+        chunk = self.map.chunks.get(key) or self.fault_chunk(key)
+        if chunk is None:
+            return
+        # the chunks around it are loaded if they were paged out, and joined to it, so the
+        # route is the same however many chunks are kept in memory
+        x0, y0 = chunk.origin[0] - CHUNK_SIZE, chunk.origin[1] - CHUNK_SIZE
+        size = CHUNK_SIZE * 3
+        kind = self.map.window('kind', x0, y0, size, size, fault=True)
+        if self.dirty:
+            self.reconcile_links()
+        links = self.map.window('links', x0, y0, size, size)
+
+        find = self.connectivity.find
+        home = find(self.component_node(self.first_room.pos))
+        start = [pos for pos, room in zip(chunk.positions(), chunk.cells) if room is not None and not room.empty()]
+        if not start or any(find(self.component_node(pos)) == home for pos in start):
+            return
 
+        # Dijkstra's algorithm, the costs are small so the queue is a list of buckets
+        # positions are relative to the corner of the area while searching, and the layers are lists as they're faster
+        kind, links = kind.tolist(), links.tolist()
+        inside = range(CHUNK_SIZE, CHUNK_SIZE * 2)
+        steps = [(d, dx, dy, link_bits[d]) for d, (dx, dy) in sides_tuples.items()]
+        cost = {(x - x0, y - y0): 0 for x, y in start}
+        prev: Dict[Tuple[int, int], Tuple[Tuple[int, int], str]] = {}
+        buckets: List[List[Tuple[int, int]]] = [list(cost)]
+        found = None
+        for c in range(size * size * 3):
+            if c >= len(buckets) or found is not None:
+                break
+            for x, y in buckets[c]:
+                if cost[(x, y)] < c:
+                    continue
+                if kind[y][x] == ROOM and not (x in inside and y in inside) \
+                        and find(self.component_node((x + x0, y + y0))) == home:
+                    found = (x, y)
+                    break
+                for d, dx, dy, bit in steps:
+                    ax, ay = x + dx, y + dy
+                    if not (0 <= ax < size and 0 <= ay < size) or kind[ay][ax] == NONE:
+                        continue
+                    if kind[ay][ax] != ROOM:
+                        step = 3
+                    else:
+                        step = 0 if links[y][x] & bit else 1
+                    if cost.get((ax, ay), c + step + 1) > c + step:
+                        cost[(ax, ay)] = c + step
+                        prev[(ax, ay)] = ((x, y), d)
+                        buckets.extend([] for _ in range(c + step + 1 - len(buckets)))
+                        buckets[c + step].append((ax, ay))
+        if found is None:
+            return  # nothing reachable nearby, the chunks between it and the reachable rooms haven't been generated
+
+        # the rooms are joined straight away, so the next new chunk can connect through this one
+        rng = worldgen.chunk_rng(self.seed, key, self.level)
+        pos = found
+        while pos in prev:
+            (lx, ly), d = prev[pos]
+            x, y = lx + x0, ly + y0
+            room = self.get(x, y)
+            if room.empty():
+                name, description, color, _, _ = self.archetypes.generate_kind(rng, 'corridor')
+                room = Room(name, description, coords=(x, y), color=color, links={d: True})
+                self.set(x, y, room)
+                self.touched.add(chunk_key(x, y))  # it can't be generated again without the corridor
+            elif not room.has_link(d):
+                room.link_bool(d)
+                self.room_changed(room)
+                self.touched.add(chunk_key(x, y))  # it can't be generated again without the link
+            self.connectivity.union((x, y), (pos[0] + x0, pos[1] + y0))
+            pos = (lx, ly)
+
+    # the room has changed, update the map layers
+    def room_changed(self, room: Room):
+        chunk = self.map.chunk(*room.pos)
+        if chunk is None or chunk.get(*room.pos) is not room:
+            return
+        was_explored = chunk.explored[room.pos[1] % CHUNK_SIZE, room.pos[0] % CHUNK_SIZE]
+        chunk.update(*room.pos)
+        if room.explored() and not was_explored:
+            self.add_explored(room)
+
+        # an explored room reveals itself and the rooms it is linked to
+        if room.explored():
+            x, y = room.pos
+            self.reveal(x, y)
+            for d, (dx, dy) in sides_tuples.items():
+                if room.has_link(d):
+                    self.reveal(x+dx, y+dy)
+
+    # keep track of explored rooms for pathfinding
+    def add_explored(self, room: Room):
+        self.explore_version += 1
+        self.touched.add(chunk_key(*room.pos))
+        self.explored_names.setdefault(room.name.lower(), set()).add(room.pos)
+
+    def reveal(self, x, y):
+        chunk = self.map.chunk(x, y)
+        if chunk is not None and chunk.kind[y % CHUNK_SIZE, x % CHUNK_SIZE] == ROOM:
+            chunk.revealed[y % CHUNK_SIZE, x % CHUNK_SIZE] = True
+            chunk.changed()
+
+    # check that every pair of adjacent rooms agree on whether they are linked, for debugging
+    def validate_links(self):
+        for (x, y), room in self.map.items():
+            if room.empty():
+                continue
+            for d, (dx, dy) in sides_tuples.items():
+                if chunk_key(x+dx, y+dy) not in self.map.chunks:
+                    continue  # paged out chunks are checked against their neighbours when they are loaded
+                adj = self.get(x+dx, y+dy)
+                assert getattr(room, adj_slots[d]) is adj, 'Wrong neighbour pointer at ' + str((x, y))
+                if adj is not None and not adj.empty():
+                    assert room.has_link(d) == adj.has_link(opposites[d]), \
+                        'Inconsistent link between ' + str((x, y)) + ' and ' + str((x+dx, y+dy))
+
+        # the layers should match the rooms
+        for chunk in self.map:
+            for (x, y), room in zip(chunk.positions(), chunk.cells):
+                lx, ly = x - chunk.origin[0], y - chunk.origin[1]
+                assert room is not None or chunk.kind[ly, lx] == NONE, 'Layers out of date at ' + str((x, y))
+                if room is not None and not room.empty():
+                    assert chunk.kind[ly, lx] == ROOM and chunk.explored[ly, lx] == room.explored() \
+                        and chunk.links[ly, lx] == room.link_mask(), 'Layers out of date at ' + str((x, y))
+            ox, oy = chunk.origin
+            assert not (self.visible_mask(ox - 1, oy - 1, CHUNK_SIZE + 2, CHUNK_SIZE + 2) & ~chunk.revealed).any(), \
+                'Revealed layer out of date in chunk ' + str(chunk.key)
+
+    # check every room on the map, much slower than reconcile_links()
     def update_all_links(self):
-        for row in self.map:
-            for room in row:
-                if room is not None:
-                    room.update_links()
+        for chunk in self.map:
+            self.dirty.add(chunk.origin)
+        self.reconcile_links()
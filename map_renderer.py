@@ -1,6 +1,9 @@
+from collections import OrderedDict
 import pygame
+import numpy as np
 from pygame.math import Vector2
-from typing import Union, Tuple
+from typing import Union, Tuple, Dict, Hashable, Callable
+from world_renderer import TileLayer, Camera
 
 
 def corner(x_pos: Tuple[float, float], x_size: Tuple[float, float]):
@@ -11,6 +14,52 @@ def center(a: Tuple[float, float], b: Tuple[float, float], offset: Tuple[float,
     return a[0] / 2 - b[0] / 2 + offset[0], a[1] / 2 - b[1] / 2 + offset[1]
 
 
+class SpriteCache:
+    """
+    Surfaces that are drawn many times, kept by a key that says what they look like (colour, size, orientation)
+    The least recently used surfaces are removed when there are more than max_size of them.
+    Surfaces are converted to the display's pixel format once there is a display, so blitting them is faster
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.surfaces: Dict[Hashable, pygame.Surface] = OrderedDict()
+        self.unconverted = set()  # keys of surfaces that were made before the display was created
+        self.hits = 0
+        self.misses = 0
+
+    # the surface for the key, make() creates it if it isn't cached
+    # the surface is shared by everything that uses the key, so it mustn't be drawn on
+    def get(self, key: Hashable, make: Callable[[], pygame.Surface]) -> pygame.Surface:
+        surf = self.surfaces.get(key)
+        if surf is None:
+            self.misses += 1
+            surf = make()
+            if pygame.display.get_surface() is not None:
+                surf = surf.convert()
+            else:
+                self.unconverted.add(key)
+            self.surfaces[key] = surf
+            if len(self.surfaces) > self.max_size:
+                self.unconverted.discard(next(iter(self.surfaces)))
+                self.surfaces.popitem(last=False)
+            return surf
+
+        self.hits += 1
+        self.surfaces.move_to_end(key)
+        if key in self.unconverted and pygame.display.get_surface() is not None:
+            surf = self.surfaces[key] = surf.convert()
+            self.unconverted.discard(key)
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+        self.unconverted.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self.surfaces), 'hits': self.hits, 'misses': self.misses}
+
+
 class MapRenderer:
     """
     This class renders everything that appears within the top-left box i.e. game view
@@ -39,7 +88,7 @@ class MapRenderer:
         inner_pad_surf.fill('black')
         self._image.blit(inner_pad_surf, (padding, padding))
         self.padding = padding
-        self.surface = pygame.Surface(map_dimensions)
+        self.surface = pygame.Surface(map_dimensions)  # only used by draw_area()
         p_size: float = 20.0
         p_padding: float = 3.0
 
@@ -66,6 +115,10 @@ class MapRenderer:
         self.room_size = 100
         self.room_spacing = 30
         self.corridor_width = 25
+        self.sprites = SpriteCache()  # the rooms and corridors, for the main view and the minimap
+        # the map view and the minimap are put together from tiles, see world_renderer.py
+        self.view = Camera(self.tile_layer(self.scale, tile_cells=4, max_tiles=24))
+        self.centre = Vector2(0, 0)  # the position the view is looking at when it isn't moving
 
         self.mm_size = (400, 400)
         self.mm_pos = (300, 100)
@@ -74,14 +127,32 @@ class MapRenderer:
         self.minimap.set_alpha(200)
         self.minimap.fill('black')
         self.mm_scale = 0.1
+        self.mm_view = Camera(self.tile_layer(self.scale * self.mm_scale))
+        self.mm_radius = 10
+        self.dirty = True  # set when the image is drawn again, see compositor.py
         self.draw()
 
     def image(self):
         return self._image
 
-    # called when the map has changed
-    def draw(self, offset=(0, 0), radius=2, scale: float = 1,
-             explore_all=False, render=True, draw_minimap=True, surf=None, surfsize=None):
+    # the map with rooms at the given scale, as tiles
+    def tile_layer(self, scale: float, **kwargs) -> TileLayer:
+        return TileLayer(self, round((self.room_size + self.room_spacing) * scale), int(self.room_size * scale),
+                         max(1, int(self.corridor_width * scale)), **kwargs)
+
+    # zoom the map view, the tiles at the old scale are thrown away
+    def set_scale(self, scale: float):
+        self.scale = scale
+        self.view.layer = self.tile_layer(scale, tile_cells=4, max_tiles=24)
+        self.draw()
+
+    # called when the map has changed, the view is centred on the player's room
+    def draw(self, offset=(0, 0)):
+        self.centre = Vector2(self.map.curr_room.pos)
+        self.draw_window(offset)
+
+    # draw the rooms around the player onto surf from scratch, without using the tiles
+    def draw_area(self, radius=2, scale: float = 1, explore_all=False, surf=None, surfsize=None):
         if surf is None:
             surf = self.surface
         if surfsize is None:
@@ -101,39 +172,66 @@ class MapRenderer:
                 if room is not None and not room.empty():
                     x2 = (x - radius) * room_spacing
                     y2 = (y - radius) * room_spacing
-                    corridor_dims = (self.room_spacing * scale + 2, self.corridor_width * scale)
-                    corridor_dims_b = (0, self.corridor_width * scale)
                     self.draw_links(x2, y2, room, scale, surf, surfsize)
 
                     surf.blit(self.draw_room(arr[y][x], scale=scale),
                               center(surfsize, (room_size, room_size), (x2, y2)))
 
-        if draw_minimap:
-            self.draw(radius=10, scale=self.mm_scale, render=False,
-                      draw_minimap=False, surf=self.minimap, surfsize=self.mm_size)
+        # shade the areas that are still being generated
+        x0, y0 = self.map.curr_room.pos
+        pending = self.map.pending_mask(x0 - radius, y0 - radius, radius * 2 + 1, radius * 2 + 1)
+        for y, x in zip(*np.nonzero(pending)):
+            surf.blit(self.draw_room(None, scale=scale, color=(25, 25, 25)),
+                      center(surfsize, (room_size, room_size),
+                             ((x - radius) * room_spacing, (y - radius) * room_spacing)))
 
-        if render:
-            self.draw_window(offset)
-        else:
-            return surf
+        return surf
 
     def draw_room(self, room, size=None, scale: float = 1, color: Union[str, Tuple[int, int, int]] = None):
         # scale *= self.scale
         if size is None:
             size = self.room_size * scale
 
-        surf = pygame.Surface((size, size))
         if color:
-            surf.fill(color)
+            fill = color
         elif room is None:
-            surf.fill((50, 0, 0))
+            fill = (50, 0, 0)
         elif not (room.explored() or room == self.map.curr_room):
-            surf.fill((100, 100, 100))
+            fill = (100, 100, 100)
         else:
-            surf.fill(room.color)
+            fill = room.color
 
+        # stairs are marked with a triangle pointing up or down
+        stairs = ''
+        if room is not None and not color and room.explored():
+            stairs = ''.join(d for d in '<>' if room.has_link(d))
+
+        return self.sprites.get(('room', int(pygame.Color(fill)), int(size), stairs),
+                                lambda: self.make_room(fill, int(size), stairs))
+
+    @staticmethod
+    def make_room(color, size: int, stairs: str) -> pygame.Surface:
+        surf = pygame.Surface((size, size))
+        surf.fill(color)
+        if '<' in stairs:
+            pygame.draw.polygon(surf, 'white', [(size * 0.3, size * 0.45), (size * 0.7, size * 0.45),
+                                                (size * 0.5, size * 0.15)])
+        if '>' in stairs:
+            pygame.draw.polygon(surf, 'white', [(size * 0.3, size * 0.55), (size * 0.7, size * 0.55),
+                                                (size * 0.5, size * 0.85)])
         return surf
 
+    # a corridor going across (e/w) or down (n/s)
+    def corridor(self, dims: Tuple[float, float], orientation: str) -> pygame.Surface:
+        w, h = (int(dims[0]), int(dims[1])) if orientation == 'across' else (int(dims[1]), int(dims[0]))
+
+        def make():
+            corr = pygame.Surface((w, h))
+            corr.fill('gray')
+            return corr
+
+        return self.sprites.get(('corridor', orientation, w, h), make)
+
     # Draw the corridors between rooms
     def draw_links(self, x, y, room, scale, surf=None, surfsize=None):
         if surf is None:
@@ -146,43 +244,45 @@ class MapRenderer:
         corridor_dims = (self.room_spacing * scale + 2, self.corridor_width * scale)
         corridor_dims_b = (0, self.corridor_width * scale)
 
-        if room.has_link('e') and not room.get_linked_room('e').empty() \
-                and (room.explored() or room.link('e').explored()):
-            corr = pygame.Surface(corridor_dims)
-            corr.fill('gray')
-            surf.blit(corr, center(surfsize, corridor_dims_b, (x + room_size / 2, y)))
+        adj = room.get_linked_room('e')
+        if adj is not None and not adj.empty() and (room.explored() or adj.explored()):
+            surf.blit(self.corridor(corridor_dims, 'across'),
+                      center(surfsize, corridor_dims_b, (x + room_size / 2, y)))
 
-        if room.has_link('s') and not room.get_linked_room('s').empty() \
-                and (room.explored() or room.link('s').explored()):
-            corr = pygame.Surface(corridor_dims[::-1])
-            corr.fill('gray')
-            surf.blit(corr, center(surfsize, corridor_dims_b[::-1], (x, y + room_size / 2)))
+        adj = room.get_linked_room('s')
+        if adj is not None and not adj.empty() and (room.explored() or adj.explored()):
+            surf.blit(self.corridor(corridor_dims, 'down'),
+                      center(surfsize, corridor_dims_b[::-1], (x, y + room_size / 2)))
 
-        if room.has_link('w') and not room.get_linked_room('w').empty() \
-                and (room.explored() or room.link('w').explored()):
-            corr = pygame.Surface(corridor_dims)
-            corr.fill('gray')
-            surf.blit(corr, center(surfsize, corridor_dims_b, (x - room_size/2 - corridor_size, y)))
+        adj = room.get_linked_room('w')
+        if adj is not None and not adj.empty() and (room.explored() or adj.explored()):
+            surf.blit(self.corridor(corridor_dims, 'across'),
+                      center(surfsize, corridor_dims_b, (x - room_size/2 - corridor_size, y)))
 
-        if room.has_link('n') and not room.get_linked_room('n').empty() \
-                and (room.explored() or room.link('n').explored()):
-            corr = pygame.Surface(corridor_dims[::-1])
-            corr.fill('gray')
-            surf.blit(corr, center(surfsize, corridor_dims_b[::-1], (x, y - room_size/2 - corridor_size)))
+        adj = room.get_linked_room('n')
+        if adj is not None and not adj.empty() and (room.explored() or adj.explored()):
+            surf.blit(self.corridor(corridor_dims, 'down'),
+                      center(surfsize, corridor_dims_b[::-1], (x, y - room_size/2 - corridor_size)))
 
+    # offset moves the view that many pixels away from self.centre, the map moves the other way
     def draw_window(self, offset=(0, 0)):
-        self.window.fill('black')
-        self.window.blit(self.surface, center(self.w_size, self.m_size, offset))
-        self.window.blit(self.minimap, (self.mm_pos[0] + offset[0] * self.mm_scale,
-                                        self.mm_pos[1] + offset[1] * self.mm_scale))
+        pos = self.centre - Vector2(offset) / self.view.layer.pitch
+        self.view.look_at(pos)
+        self.view.draw(self.window)
+        self.mm_view.look_at(pos)
+        self.mm_view.draw(self.minimap, self.mm_radius)
+        self.window.blit(self.minimap, self.mm_pos)
         self.window.blit(self.player_surf, center(self.w_size, self.p_size))
         self._image.blit(self.window, (self.total_padding, self.total_padding))
+        self.dirty = True
 
     # animates the movement between rooms, but has to suspend the rest of the program for the duration
     def move(self, draw_func, direction, time: int = 30):
-        dist = (self.room_size + self.room_spacing) * self.scale
+        dist = self.view.layer.pitch
         start = Vector2(0, 0)
-        end = {'n': Vector2(0, dist), 'e': Vector2(-dist, 0), 's': Vector2(0, -dist), 'w': Vector2(dist, 0)}[direction]
+        # taking the stairs doesn't move the view
+        end = {'n': Vector2(0, dist), 'e': Vector2(-dist, 0), 's': Vector2(0, -dist),
+               'w': Vector2(dist, 0)}.get(direction, Vector2(0, 0))
 
         for i in range(time):
             self.draw_window(start.lerp(end, (i+1)/time))
@@ -194,9 +294,11 @@ class MapRenderer:
 
     # called each tick of the animation by the Coroutine class
     def move_coroutine(self, i: int, end: int, direction: str):
-        dist = (self.room_size + self.room_spacing) * self.scale
+        dist = self.view.layer.pitch
         start = Vector2(0, 0)
-        dest = {'n': Vector2(0, dist), 'e': Vector2(-dist, 0), 's': Vector2(0, -dist), 'w': Vector2(dist, 0)}[direction]
+        # taking the stairs doesn't move the view
+        dest = {'n': Vector2(0, dist), 'e': Vector2(-dist, 0), 's': Vector2(0, -dist),
+                'w': Vector2(dist, 0)}.get(direction, Vector2(0, 0))
 
         self.draw_window(start.lerp(dest, (i+1)/end))
         # self.draw(offset=start.lerp(dest, (i+1)/end))
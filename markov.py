@@ -0,0 +1,125 @@
+"""
+Generates words that look like the words in a corpus, using a character n-gram (Markov chain) model
+The compiled model is cached in a file and is only trained again when the corpus changes
+"""
+
+import hashlib
+import json
+import os
+from bisect import bisect
+from itertools import accumulate
+from random import Random
+from typing import Dict, List, Tuple, Optional, Iterable
+
+START = '^'  # pads the start of each word, so the first letters have a context
+END = '$'
+
+
+class MarkovNames:
+    """
+    Each context of `order` characters maps to the characters that can follow it, with cumulative counts
+    so that choosing the next character is a binary search
+    """
+
+    def __init__(self,
+                 tables: Dict[str, Tuple[str, List[int]]],
+                 order: int = 3,
+                 min_length: int = 4,
+                 max_length: int = 12):
+        self.tables = tables
+        self.order = order
+        self.min_length = min_length
+        self.max_length = max_length
+
+    @staticmethod
+    def train(words: Iterable[str], order: int = 3) -> 'MarkovNames':
+        counts: Dict[str, Dict[str, int]] = {}
+        for word in words:
+            word = START * order + word.lower() + END
+            for i in range(order, len(word)):
+                following = counts.setdefault(word[i-order:i], {})
+                following[word[i]] = following.get(word[i], 0) + 1
+
+        tables = {}
+        for context, following in counts.items():
+            chars = ''.join(sorted(following))
+            tables[context] = (chars, list(accumulate(following[c] for c in chars)))
+        return MarkovNames(tables, order)
+
+    # generate a word, words that are too short or too long are thrown away and generated again
+    def sample(self, rng: Random) -> str:
+        random = rng.random
+        word = ''
+        for _ in range(20):
+            context = START * self.order
+            word = ''
+            while len(word) <= self.max_length:
+                chars, cumulative = self.tables[context]
+                c = chars[bisect(cumulative, random() * cumulative[-1])]
+                if c == END:
+                    break
+                word += c
+                context = context[1:] + c
+            if self.min_length <= len(word) <= self.max_length:
+                break
+        return word[:self.max_length].capitalize()
+
+
+# the hash of every .txt file in the corpus directory, used to check if the cached model is out of date
+def corpus_hash(corpus_dir: str, order: int) -> str:
+    h = hashlib.sha1(str(order).encode())
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.txt'):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                h.update(name.encode() + b'\0' + f.read())
+    return h.hexdigest()
+
+
+# one word per line, blank lines and lines starting with # are ignored
+def read_corpus(corpus_dir: str) -> List[str]:
+    words = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith('.txt'):
+            with open(os.path.join(corpus_dir, name), 'r', encoding='utf-8') as f:
+                words.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return words
+
+
+# load the model from the cache file, or train it if the corpus has changed, returns None if the corpus is empty
+def load_model(corpus_dir: str, cache_path: str, order: int = 3) -> Optional[MarkovNames]:
+    if not os.path.isdir(corpus_dir):
+        return None
+    digest = corpus_hash(corpus_dir, order)
+
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if cache['hash'] == digest:
+            if cache['tables'] is None:
+                return None
+            return MarkovNames({context: (chars, cumulative) for context, (chars, cumulative)
+                                in cache['tables'].items()}, order)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    words = read_corpus(corpus_dir)
+    model = MarkovNames.train(words, order) if words else None
+    # written to a temporary file first, as the pregenerator's worker processes might load it at the same time
+    try:
+        tmp = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'hash': digest, 'tables': None if model is None else model.tables}, f)
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass  # the model still works without the cache
+    return model
+
+
+# Test code
+if __name__ == "__main__":
+    m = load_model('./Data/Names', './Data/Names/names.model')
+    if m is None:
+        print('No names in ./Data/Names')
+    else:
+        r = Random()
+        print(', '.join(m.sample(r) for _ in range(20)))
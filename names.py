@@ -0,0 +1,96 @@
+"""
+Generates room names by filling in templates with random nouns and with place names from a Markov chain
+trained on the corpus in Data/Names (see markov.py)
+The word list and the model are only loaded the first time a name is needed, so importing this module costs nothing
+"""
+
+import json
+import os
+from random import Random
+from typing import List, Tuple, Callable, Optional
+from random_words.random_words import main_dir
+from markov import MarkovNames, load_model
+
+# templates for room names, each number is replaced with a random word and each @ with a generated place name
+templates = ['1 of 2', '1\'s 2', 'The 1ian 2',  'The Dungeon of 1', 'Hall of 1', 'The 1 of Mystery',
+             'The Halls of @', '@ Keep', 'The 1 of @', 'The Caves of @']
+
+# relative to this file rather than the working directory, so every process generates the same names
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data', 'Names')
+MODEL_CACHE = os.path.join(CORPUS_DIR, 'names.model')
+
+WORD = 0
+PLACE = 1
+
+
+# turn each template into a format function and what to fill it with
+def compile_template(template: str) -> Tuple[Callable[..., str], Tuple[int, ...]]:
+    fills = []
+    for i in range(1, 10):
+        if str(i) not in template:
+            break
+        fills.append(WORD)
+        template = template.replace(str(i), '{' + str(i - 1) + '}')
+    while '@' in template:
+        fills.append(PLACE)
+        template = template.replace('@', '{' + str(len(fills) - 1) + '}', 1)
+    return template.format, tuple(fills)
+
+
+compiled: List[Tuple[Callable[..., str], Tuple[int, ...]]] = []
+words: List[str] = []  # every noun, capitalised and in a fixed order so names only depend on the random generator
+model: List[Optional[MarkovNames]] = []
+
+
+def word_list() -> List[str]:
+    if not words:
+        with open(os.path.join(main_dir, 'nouns.dat'), 'r') as f:
+            nouns = json.load(f)
+        words.extend(w.capitalize() for letter in sorted(nouns) for w in nouns[letter])
+    return words
+
+
+def place_model() -> Optional[MarkovNames]:
+    if not model:
+        model.append(load_model(CORPUS_DIR, MODEL_CACHE))
+    return model[0]
+
+
+# templates with place names are left out if there is no corpus to train the model on
+def compile_templates(template_list: List[str]) -> List[Tuple[Callable[..., str], Tuple[int, ...]]]:
+    places = place_model() is not None
+    return [t for t in map(compile_template, template_list) if places or PLACE not in t[1]]
+
+
+def compiled_templates() -> List[Tuple[Callable[..., str], Tuple[int, ...]]]:
+    if not compiled:
+        compiled.extend(compile_templates(templates))
+    return compiled
+
+
+def random_name(rng: Random) -> str:
+    return random_names(rng, 1)[0]
+
+
+# generate many names at once, gives the same names as calling random_name() count times
+# template_list is a list from compile_templates(), the default templates are used if it is None or empty
+def random_names(rng: Random, count: int, template_list=None) -> List[str]:
+    choice = rng.choice
+    word_choices = word_list()
+    places = place_model()
+    templates_ = template_list or compiled_templates()
+    names = []
+    for _ in range(count):
+        template, fills = choice(templates_)
+        if fills == (WORD,):
+            names.append(template(choice(word_choices)))
+        elif fills == (WORD, WORD):
+            names.append(template(choice(word_choices), choice(word_choices)))
+        else:
+            names.append(template(*[choice(word_choices) if fill == WORD else places.sample(rng) for fill in fills]))
+    return names
+
+
+# Test code
+if __name__ == "__main__":
+    print('\n'.join(random_names(Random(), 10)))
@@ -0,0 +1,160 @@
+from collections import OrderedDict
+from tempfile import TemporaryFile
+from typing import Dict, Tuple, Optional
+import numpy as np
+from chunk import CHUNK_SIZE, chunk_key
+from save import CELL, Interner, encode_chunk
+
+
+class ChunkPager:
+    """
+    Keeps the number of chunks in memory under a budget by removing the chunks that the player visited
+    least recently, as long as they are far enough away
+    Chunks that haven't changed since they were generated or loaded are dropped, as the map can recreate them,
+    other chunks are written to a swap file. Map.fault_chunk() brings them back when they are needed again
+    The budget covers the chunks of every level, levels the player isn't on are paged out first and always
+    written to the swap file, so going back to a level doesn't generate it again
+    """
+
+    def __init__(self,
+                 map_obj,
+                 budget: int = 512,  # maximum number of chunks in memory
+                 keep_distance: int = 3):  # chunks this close to the player (in chunks) are never removed
+        self.map = map_obj
+        self.map.pager = self
+        self.budget = budget
+        # at least 1, as the links of the rooms along the edges of the player's chunk depend on the chunks next to it
+        self.keep_distance = max(1, keep_distance)
+        self.lru: Dict[Tuple[int, Tuple[int, int]], None] = OrderedDict()  # by level and key
+
+        # the swap file has a fixed-size record for each chunk that has been written to it, by level and key
+        self.swap = TemporaryFile()
+        self.offsets: Dict[Tuple[int, Tuple[int, int]], int] = {}
+        self.strings = Interner()
+        self.palette = Interner()
+
+        self.hits = 0  # the player entered a chunk that was in memory
+        self.faults = 0  # a chunk had to be loaded or generated again
+        self.evictions = 0
+        self.written = 0  # evictions that were written to the swap file instead of dropped
+        self.last_key = None
+        self.faulted_keys = set()  # chunks loaded since the last poll, entering them isn't a hit
+
+    # called each frame, evicts chunks if there are too many in memory
+    def poll(self):
+        key = chunk_key(*self.map.curr_room.pos)
+        if key != self.last_key:
+            self.last_key = key
+            if key not in self.faulted_keys:
+                self.hits += 1
+            self.visit(key)
+            self.load_around(key)
+        self.faulted_keys.clear()
+
+        # faulted chunks need their edges checking against their neighbours, before the neighbours can be evicted
+        if self.map.dirty:
+            self.map.reconcile_links()
+
+        if self.resident() > self.budget:
+            self.evict(self.resident() - self.budget)
+
+    # the number of chunks in memory on every level
+    def resident(self) -> int:
+        return len(self.map.map.chunks) + sum(len(state['map'].chunks) for state in self.map.levels.values())
+
+    # bring back the chunks next to the player's chunk if they were removed
+    def load_around(self, key: Tuple[int, int]):
+        for cy in range(key[1] - 1, key[1] + 2):
+            for cx in range(key[0] - 1, key[0] + 2):
+                if (cx, cy) not in self.map.map.chunks and (cx, cy) in self.map.generated:
+                    self.map.fault_chunk((cx, cy))
+
+    def visit(self, key: Tuple[int, int]):
+        self.lru[(self.map.level, key)] = None
+        self.lru.move_to_end((self.map.level, key))
+
+    def faulted(self, key: Tuple[int, int]):
+        self.faults += 1
+        self.faulted_keys.add(key)
+        self.visit(key)
+
+    # called before the player changes level, the old level stays in memory until the pager is over budget
+    def leave_level(self):
+        self.last_key = None
+
+    # page out count chunks, from the levels the player isn't on first
+    def evict(self, count: int):
+        player_level = self.map.level
+        for level in list(self.map.levels):
+            if count > 0 and self.map.levels[level]['map'].chunks:
+                self.map.use_level(level)
+                count = self.evict_level(count, player_level=False)
+        self.map.use_level(player_level)
+        if count > 0:
+            self.evict_level(count, player_level=True)
+
+    # page out up to count chunks of the map's current level, returns how many are still to be paged out
+    # the chunks near the player are only kept on the player's level
+    def evict_level(self, count: int, player_level: bool) -> int:
+        chunks = self.map.map.chunks
+        level = self.map.level
+        for key in chunks:  # chunks the pager hasn't seen yet count as the least recent
+            if (level, key) not in self.lru:
+                self.lru[(level, key)] = None
+                self.lru.move_to_end((level, key), last=False)
+
+        px, py = chunk_key(*self.map.curr_room.pos)
+        for lru_key in [lru_key for lru_key in self.lru if lru_key[0] == level]:
+            if count <= 0:
+                break
+            key = lru_key[1]
+            if key not in chunks:
+                del self.lru[lru_key]
+                continue
+            if player_level and max(abs(key[0] - px), abs(key[1] - py)) <= self.keep_distance:
+                continue
+
+            if key in self.map.touched or not player_level:
+                self.write(chunks[key])
+                self.written += 1
+            self.map.unload_chunk(key)
+            del self.lru[lru_key]
+            self.evictions += 1
+            count -= 1
+        self.map.trim_connectivity()
+        return count
+
+    # chunks are always written and loaded on the map's current level
+    def write(self, chunk):
+        cells = encode_chunk(chunk, self.strings, self.palette)
+        key = (self.map.level, chunk.key)
+        if key not in self.offsets:
+            self.swap.seek(0, 2)
+            self.offsets[key] = self.swap.tell()
+        self.swap.seek(self.offsets[key])
+        self.swap.write(cells.tobytes())
+
+    # the cells of a chunk in the swap file, or None
+    def load(self, key: Tuple[int, int]) -> Optional[np.ndarray]:
+        if (self.map.level, key) not in self.offsets:
+            return None
+        self.swap.seek(self.offsets[(self.map.level, key)])
+        return np.frombuffer(self.swap.read(CELL.itemsize * CHUNK_SIZE * CHUNK_SIZE), CELL)
+
+    # keys of the chunks on the current level that have been written to the swap file
+    def keys(self):
+        return [key for level, key in self.offsets if level == self.map.level]
+
+    def string(self, i: int) -> str:
+        return self.strings.values[i]
+
+    def color(self, i: int) -> Tuple[int, int, int]:
+        return self.palette.values[i]
+
+    def stats(self) -> Dict[str, int]:
+        return {'resident': self.resident(), 'hits': self.hits, 'faults': self.faults,
+                'evictions': self.evictions, 'written': self.written}
+
+    def close(self):
+        self.swap.close()
+        self.map.pager = None
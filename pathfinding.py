@@ -0,0 +1,149 @@
+from collections import deque, OrderedDict
+from heapq import heappush, heappop
+from typing import Dict, Tuple, Optional, List, Deque, Set, Iterator
+from chunk import CHUNK_SIZE, link_bits
+
+sides = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
+
+
+class DistanceField:
+    """
+    Distances from one room to the explored rooms around it
+    The breadth-first search is only expanded as far as it is needed, and can be continued by later searches
+    """
+
+    def __init__(self, finder: 'PathFinder', start: Tuple[int, int]):
+        self.finder = finder
+        self.start = start
+        self.dist: Dict[Tuple[int, int], int] = {start: 0}
+        self.prev: Dict[Tuple[int, int], str] = {}  # direction taken to reach each position
+        self.queue: Deque[Tuple[int, int]] = deque([start])
+
+    # expand the search by one room, returns the newly reached positions
+    def step(self) -> List[Tuple[int, int]]:
+        pos = self.queue.popleft()
+        dist = self.dist[pos] + 1
+        new = []
+        for d, adj in self.finder.neighbours(pos):
+            if adj not in self.dist:
+                self.dist[adj] = dist
+                self.prev[adj] = d
+                self.queue.append(adj)
+                new.append(adj)
+        return new
+
+    # find the closest of the target positions, or None if none of them can be reached
+    def nearest(self, targets: Set[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+        best = min((pos for pos in targets if pos in self.dist), key=self.dist.get, default=None)
+
+        # anything not reached yet is at least as far away as the front of the queue
+        while self.queue and (best is None or self.dist[self.queue[0]] < self.dist[best]):
+            for pos in self.step():
+                if pos in targets and (best is None or self.dist[pos] < self.dist[best]):
+                    best = pos
+        return best
+
+    # the directions to move in to get from the start to pos
+    def path_to(self, pos: Tuple[int, int]) -> List[str]:
+        path = []
+        while pos != self.start:
+            d = self.prev[pos]
+            path.append(d)
+            pos = (pos[0] - sides[d][0], pos[1] - sides[d][1])
+        return path[::-1]
+
+
+class PathFinder:
+    """
+    Finds routes through the explored rooms of the map
+    Distance fields are cached for each starting room until the explored area changes
+    """
+
+    def __init__(self, map_obj, cache_size: int = 8):
+        self.map = map_obj
+        self.cache_size = cache_size
+        self.fields: Dict[Tuple[int, int], DistanceField] = OrderedDict()
+        self.version = map_obj.explore_version
+
+    # explored rooms that are linked to the room at pos
+    def neighbours(self, pos: Tuple[int, int]) -> Iterator[Tuple[str, Tuple[int, int]]]:
+        x, y = pos
+        store = self.map.map
+        chunks = store.chunks
+        # chunks that have been paged out are loaded again through store.chunk()
+        chunk = chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE)) or store.chunk(x, y)
+        mask = chunk.links.item(y % CHUNK_SIZE, x % CHUNK_SIZE)
+        for d, bit in link_bits.items():
+            if mask & bit:
+                ax, ay = x + sides[d][0], y + sides[d][1]
+                chunk = chunks.get((ax // CHUNK_SIZE, ay // CHUNK_SIZE)) or store.chunk(ax, ay)
+                if chunk is not None and chunk.explored.item(ay % CHUNK_SIZE, ax % CHUNK_SIZE):
+                    yield d, (ax, ay)
+
+    def field(self, start: Tuple[int, int]) -> DistanceField:
+        if self.version != self.map.explore_version:
+            self.fields.clear()
+            self.version = self.map.explore_version
+
+        if start in self.fields:
+            self.fields.move_to_end(start)
+        else:
+            self.fields[start] = DistanceField(self, start)
+            if len(self.fields) > self.cache_size:
+                self.fields.popitem(last=False)
+        return self.fields[start]
+
+    # returns a list of directions from start to goal, or None if there is no known route
+    def path(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[str]]:
+        field = self.field(start)
+        if goal in field.dist:
+            return field.path_to(goal)
+        # there's no point searching the explored rooms if there isn't a route through all the rooms
+        if not self.map.reachable(start, goal):
+            return None
+        return self.astar(start, goal)
+
+    def astar(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[str]]:
+        heuristic = lambda a: abs(a[0] - goal[0]) + abs(a[1] - goal[1])
+        dist = {start: 0}
+        prev: Dict[Tuple[int, int], str] = {}
+        heap = [(heuristic(start), 0, start)]
+
+        # ties are broken in favour of the rooms furthest from the start, which avoids
+        # searching every equally good route on open areas of the map
+        while heap:
+            _, d, pos = heappop(heap)
+            d = -d
+            if pos == goal:
+                path = []
+                while pos != start:
+                    direction = prev[pos]
+                    path.append(direction)
+                    pos = (pos[0] - sides[direction][0], pos[1] - sides[direction][1])
+                return path[::-1]
+            if d > dist[pos]:
+                continue
+            for direction, adj in self.neighbours(pos):
+                if adj not in dist or d + 1 < dist[adj]:
+                    dist[adj] = d + 1
+                    prev[adj] = direction
+                    heappush(heap, (d + 1 + heuristic(adj), -(d + 1), adj))
+
+        return None
+
+    # the closest explored room with a matching name, exact matches are preferred over partial ones
+    def find(self, start: Tuple[int, int], name: str) -> Optional[Tuple[int, int]]:
+        name = name.strip().lower()
+        names = self.map.explored_rooms()
+        matches = [names[name]] if name in names else []
+        if not matches:
+            matches = [pos for n, pos in names.items() if n.startswith(name)]
+        if not matches:
+            matches = [pos for n, pos in names.items() if name in n]
+        if not matches:
+            return None
+
+        targets = set().union(*matches)
+        if len(targets) == 1:  # path() will use A* to find the route
+            return targets.pop()
+        return self.field(start).nearest(targets)
@@ -1,6 +1,7 @@
 from event import *
 from room import *
 from item import *
+from chunk import stair_bits, stair_levels
 
 
 class Player:
@@ -11,12 +12,18 @@ class Player:
     def __init__(self, map_, health=3, items=None):
         self.items = items if items is not None else [Item('ExampleItem')]
         self.map = map_
-        self.room = self.map.first_room
+        self.room = self.map.curr_room
         self.room._explored = True
         self.hp = health
 
+    # direction is n, e, s or w, or < or > to take the stairs up or down to another level
     def move(self, direction):
-        new_room: Room = self.room.get_linked_room(direction)
+        if direction in stair_bits:
+            new_room = None
+            if self.room.has_link(direction):
+                new_room = self.map.change_level(self.map.level + stair_levels[direction], self.room.pos)
+        else:
+            new_room: Room = self.room.get_linked_room(direction)
         if new_room is None or new_room.empty():
             ev = Event('error', 'game', 'no_room', p=self, direction=direction, room=self.room)
         else:
@@ -0,0 +1,94 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from math import sqrt
+from typing import Dict, Tuple, Deque, Optional
+from chunk import chunk_key
+import worldgen
+
+
+class Pregenerator:
+    """
+    Generates chunks in a pool of worker processes ahead of the player
+    Chunks in the direction the player has been moving are generated first, and finished chunks are
+    added to the map by poll(), which should be called between frames
+    """
+
+    def __init__(self,
+                 map_obj,
+                 workers: Optional[int] = None,
+                 radius: int = 2,  # how far ahead to generate, in chunks
+                 max_pending: int = 8,
+                 history: int = 8):  # number of recent moves used to work out the direction of travel
+        self.map = map_obj
+        self.map.pregenerator = self
+        self.pool = ProcessPoolExecutor(workers)
+        self.radius = radius
+        self.max_pending = max_pending
+        self.pending: Dict[Tuple[int, int], Future] = {}
+        self.moves: Deque[Tuple[int, int]] = deque(maxlen=history)
+        self.last_pos = self.map.curr_room.pos
+        self.schedule()
+
+    # called each frame, merges finished chunks and schedules more if the player has moved
+    def poll(self):
+        pos = self.map.curr_room.pos
+        if pos != self.last_pos:
+            self.moves.append((pos[0] - self.last_pos[0], pos[1] - self.last_pos[1]))
+            self.last_pos = pos
+
+        merged = False
+        for key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                if key not in self.map.generated:
+                    self.map.merge_chunk(key, future.result())
+                    merged = True
+
+        if merged:
+            self.map.reconcile_links()
+        self.schedule()
+
+    # wait for a chunk if it is being generated, returns False if it isn't
+    def collect(self, key: Tuple[int, int]) -> bool:
+        future = self.pending.pop(key, None)
+        if future is None:
+            return False
+        if key not in self.map.generated:
+            self.map.merge_chunk(key, future.result())
+        return True
+
+    def schedule(self):
+        if len(self.pending) >= self.max_pending:
+            return
+
+        hx, hy = sum(m[0] for m in self.moves), sum(m[1] for m in self.moves)
+        length = sqrt(hx * hx + hy * hy) or 1
+        px, py = chunk_key(*self.map.curr_room.pos)
+
+        # nearest chunks first, chunks ahead of the player count as up to one chunk closer
+        candidates = []
+        for cy in range(py - self.radius, py + self.radius + 1):
+            for cx in range(px - self.radius, px + self.radius + 1):
+                key = (cx, cy)
+                if key in self.map.generated or key in self.pending:
+                    continue
+                dx, dy = cx - px, cy - py
+                candidates.append((max(abs(dx), abs(dy)) - (dx * hx + dy * hy) / length, key))
+
+        candidates.sort()
+        for _, key in candidates[:self.max_pending - len(self.pending)]:
+            self.pending[key] = self.pool.submit(worldgen.generate_chunk, self.map.seed, key, self.map.room_chance,
+                                                 None, self.map.level)
+
+    # forget the chunks that are being generated, e.g. when the player changes level
+    # chunks that have already started are still finished by the workers, but aren't used
+    def cancel(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+    # chunks that haven't started are cancelled, the pool doesn't wait for the ones that have
+    def shutdown(self):
+        self.cancel()
+        self.pool.shutdown(wait=False)
+        self.map.pregenerator = None
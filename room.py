@@ -1,15 +1,18 @@
-from typing import Tuple, Union, Optional, Dict
-from random import randint, shuffle, random, choice
+import sys
+from types import MappingProxyType
+from typing import Tuple, Union, Optional, Dict, Mapping
+from random import Random
 from pygame import Color, Vector2
-from random_words import RandomWords
+from chunk import link_bits, exit_bits
+from item import Item
+import names
+import archetypes
 
 sides = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
 opposites = {'n': 's', 'e': 'w', 's': 'n', 'w': 'e'}
+# attributes holding the room next to a room in each direction
+adj_slots = {'n': 'adj_n', 'e': 'adj_e', 's': 'adj_s', 'w': 'adj_w'}
 
-# templates for room names, replace each number with a random word
-templates = ['1 of 2', '1\'s 2', 'The 1ian 2',  'The Dungeon of 1', 'Hall of 1', 'The 1 of Mystery']
-
-rw = RandomWords()
 debug = False
 LINK_CHANCE_DEFAULT = 0.7
 
@@ -18,8 +21,15 @@ class Room:
     """
     Represents each of the rooms in the game
     Has many deprecated methods, not removed in case it breaks something
+    Rooms use __slots__ and keep their links and stairs as a bit mask (see chunk.exit_bits) and their colour as a
+    packed integer, as there can be hundreds of thousands of them
+    The rooms next to it are kept in adj_n, adj_e, adj_s and adj_w by the Map, None if they aren't loaded
+    The text from __str__ is cached until the room or one of its neighbours changes
     """
 
+    __slots__ = ('_name', '_description', 'pos', '_explored', '_color', '_mask', '_links',
+                 'adj_n', 'adj_e', 'adj_s', 'adj_w', '_info', 'item')
+
     map_obj = None
 
     def __init__(self,
@@ -28,33 +38,82 @@ class Room:
                  coords: Tuple[int, int] = (0, 0),
                  color: Union[str, Tuple[int, int, int]] = None,
                  links: Dict[str, bool] = None,
-                 explored: bool = False):
+                 explored: bool = False,
+                 item: Optional[Item] = None):
+        self._info = None
+        self.adj_n = self.adj_e = self.adj_s = self.adj_w = None
         self.name = name
         self.description = description
         self.pos = coords
         self._explored = explored
-        random_color = [randint(0, 200) for _ in range(3)]
-        shuffle(random_color)
-        self.color = Color(random_color if color is None else color)
-        directions = ['n', 's', 'e', 'w']
-        # self.links_bool = {'n': False, 'e': False, 's': False, 'w': False}
-        self.links_bool = {n: links[n] if n in links else False for n in directions} if links \
-            else {n: False for n in directions}
-
-        self.links = {n: self.get_linked_room(n) for n in [d for d in directions if self.has_link(d)]}
-
-        # print(self.links)
-        # print(self.links_bool)
+        self.color = Room.random_color() if color is None else color
+        self.item = item
+        self._mask = 0
+        if links:
+            for d, bit in exit_bits.items():
+                if links.get(d):
+                    self._mask |= bit
+
+        self._links = None  # only filled in by link_room(), use get_linked_room() to find the linked rooms
+
+    # names and descriptions are shared between rooms, e.g. the descriptions of each kind of room
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        self._name = sys.intern(name)
+        self.invalidate(neighbours=True)
+
+    @property
+    def description(self) -> str:
+        return self._description
+
+    @description.setter
+    def description(self, description: str):
+        self._description = sys.intern(description)
+        self.invalidate()
+
+    # the text from __str__ has to be built again, the neighbours' text includes the name of this room
+    def invalidate(self, neighbours=False):
+        self._info = None
+        if neighbours:
+            for adj in (self.adj_n, self.adj_e, self.adj_s, self.adj_w):
+                if adj is not None:
+                    adj._info = None
+
+    @property
+    def color(self) -> Color:
+        return Color(self._color)
+
+    @color.setter
+    def color(self, color):
+        self._color = int(Color(color))
+
+    @property
+    def links(self) -> Dict[str, 'Room']:
+        if self._links is None:
+            self._links = {}
+        return self._links
+
+    # the links as a read-only dictionary, assigning to it raises a TypeError, use link_bool() to change them
+    @property
+    def links_bool(self) -> Mapping[str, bool]:
+        return MappingProxyType({d: bool(self._mask & bit) for d, bit in exit_bits.items()})
 
     def link_room(self, direction: str, room: 'Room' = None):
         if room is None:
-            if self.links_bool[direction]:
-                return self.links[direction]
+            if self.has_link(direction):
+                return self.links.get(direction)
             else:
                 return None
         else:
             self.links[direction] = room
-            self.links_bool[direction] = True
+            self._mask |= link_bits[direction]
+            self.invalidate()
+            if self.map_obj is not None:
+                self.map_obj.mark_dirty(self.pos)
 
     @staticmethod
     def link_rooms(first, second, direction: str):
@@ -63,22 +122,19 @@ class Room:
         second.link_room(mapper(direction), first)
         return
 
-    def description(self, description: str = None):
-        if description is None:
-            return self.description
-        else:
-            self.description = description
-
     def empty(self):
         return False
 
     @staticmethod
     def get_dname(direction_char):
-        return {'n': "North", 'e': "East", 's': "South", 'w': "West"}[direction_char]
+        return {'n': "North", 'e': "East", 's': "South", 'w': "West", '<': "Up", '>': "Down"}[direction_char]
 
     # Convert to a string, for printing info
     # Use Room.name to get just the name
     def __str__(self):
+        if self._info is not None and not debug:
+            return self._info
+
         string = ''
         x, y = self.pos
 
@@ -86,20 +142,30 @@ class Room:
 
         if debug:  # Debugging information
             string += '\n<Debug>: '
-            for d, val in self.links_bool.items():
-                string += d.upper() + ': ' + str(1 if val else 0) + ', '
+            for d, bit in link_bits.items():
+                string += d.upper() + ': ' + str(1 if self._mask & bit else 0) + ', '
             string += 'Pos: (' + str(x) + ', ' + str(y) + ')'  # Note that north is negative y
 
         for d in ['n', 's', 'e', 'w']:  # Print nearby rooms
-            if d in self.links_bool and self.get_linked_room(d) is not None \
+            if self.get_linked_room(d) is not None \
                     and not self.get_linked_room(d).empty():
 
                 l = self.get_linked_room(d)
                 string += '\n' + Room.get_dname(d) + ': ' + (l.name if l.explored() else 'Unknown')
 
+        for d in ['<', '>']:
+            if self.has_link(d):
+                string += '\n' + Room.get_dname(d) + ': Stairs'
+
+        if self.item is not None:
+            string += '\nYou see: ' + str(self.item)
+
         string += '\nLocation: ' + str(-y) + 'N ' + str(x) + 'E'  # print location with compass direction
+        if self.map_obj is not None and self.map_obj.level != 0:
+            string += ', level ' + str(self.map_obj.level)
 
-        return string + ''
+        self._info = string
+        return string
 
     def get_details(self):
         return {'obj': self, 'name': self.name, 'description': self.description, 'links': self.links}
@@ -107,72 +173,96 @@ class Room:
     # This method should be used to get linked rooms
     def get_linked_room(self, direction):
         if self.has_link(direction):
-            newpos = (self.pos[0] + sides[direction][0], self.pos[1] + sides[direction][1])
-            room = self.map_obj.get(newpos)
-            # print(room.name) if room else print('none')
+            room = self.get_adj_room(direction)
             return Empty() if room is None else room
         else:
             return None
 
     def get_adj_room(self, direction):
-        newpos = (self.pos[0] + sides[direction][0], self.pos[1] + sides[direction][1])
-        return self.map_obj.get(newpos)
+        room = getattr(self, adj_slots[direction])
+        if room is None and self.map_obj is not None:  # not generated or not loaded yet
+            newpos = (self.pos[0] + sides[direction][0], self.pos[1] + sides[direction][1])
+            room = self.map_obj.get(newpos)
+        return room
 
     # Ensure consistency between adjacent rooms as to whether they are linked or not
     def update_links(self):
         for d, (x, y) in sides.items():
             adj: Room = self.get_adj_room(d)
             if adj and adj.has_link(opposites[d]):
-                self.links_bool[d] = True
+                self._mask |= link_bits[d]
+        self.invalidate()
+        if self.map_obj is not None:
+            self.map_obj.room_changed(self)
 
     def link(self, direction: str, new_room: 'Room' = None):
         return self.link_room(direction, new_room) if new_room else self.get_linked_room(direction)
 
     def has_link_dict(self, direction):
-        return direction in self.links
+        return self._links is not None and direction in self._links
 
     # this method should be used for find if a room is linked
     def has_link(self, direction):
-        return self.links_bool[direction]
+        return bool(self._mask & exit_bits[direction])
 
     def explored(self, modify=False, value=True):
         if modify:
             self._explored = value
+            self.invalidate(neighbours=True)
+            if self.map_obj is not None:
+                self.map_obj.room_changed(self)
         return self._explored
 
+    # the links and stairs as an integer, see chunk.exit_bits
+    def link_mask(self):
+        return self._mask
+
+    # replace all the links, used by the map when it reconciles links so the room isn't marked dirty again
+    def set_link_mask(self, mask: int):
+        self._mask = mask
+        self.invalidate()
+
     def link_bool(self, direction, value=True):
-        self.links_bool[direction] = value
+        if value:
+            self._mask |= exit_bits[direction]
+        else:
+            self._mask &= ~exit_bits[direction]
+        self.invalidate()
+        if self.map_obj is not None:
+            self.map_obj.mark_dirty(self.pos)
 
     def setpos(self, x: Union[Tuple[int, int], int], y: Optional[int] = None):
         if y is None:
             self.pos = x
         else:
             self.pos = (x, y)
+        self.invalidate()
         return self
 
-    # Create and return a random room
+    # Create and return a random room, of one of the kinds in archetypes.py
+    # seed can be a random.Random object, so that many rooms can be generated from the same sequence
     @staticmethod
     def random(seed=None, pos: Tuple[int, int] = (0, 0), link_chance=None):
-        if link_chance is None:
-            link_chance = LINK_CHANCE_DEFAULT
-
-        links = {'s': random() < link_chance, 'e': random() < link_chance}
+        rng = seed if isinstance(seed, Random) else Random(seed)
+        table = archetypes.default_table()
+        name, description, color, mask, item = table.generate(rng, 1, link_chance)[0]
+        links = {d: bool(mask & bit) for d, bit in link_bits.items()}
+        room = Room(name, description, coords=pos, color=color, links=links, item=table.item(item))
 
-        item = Room(Room.random_name(), '<Randomly generated>', coords=pos,
-                    links={'s': random() < link_chance, 'e': random() < link_chance})
+        return room, links
 
-        return item, links
+    @staticmethod
+    def random_color(seed=None):
+        rng = seed if isinstance(seed, Random) else Random(seed)
+        color = [rng.randint(0, 200) for _ in range(3)]
+        rng.shuffle(color)
+        return tuple(color)
 
-    # Generates terrible room names
+    # Generates terrible room names, see names.py
     @staticmethod
-    def random_name():
-        s = choice(templates)
-        for i in range(1, 4):
-            if str(i) in s:
-                s = s.replace(str(i), rw.random_word().capitalize())
-            else:
-                break
-        return s
+    def random_name(seed=None):
+        rng = seed if isinstance(seed, Random) else Random(seed)
+        return names.random_name(rng)
 
 
 class EmptyRoom(Room):
@@ -181,6 +271,8 @@ class EmptyRoom(Room):
     The Empty() function is used to get a reference to this object
     """
 
+    __slots__ = ()
+
     obj = None
 
     def __init__(self):
@@ -189,10 +281,11 @@ class EmptyRoom(Room):
 
     def __str__(self): return 'Empty'
     def link_room(self, direction: str, room: 'Room' = None): return None
-    def description(self, description: str = None): return 'Empty'
     def get_details(self): return 'Empty'
     def explored(self, modify=False, value=True): return False
     def has_link(self, direction): return False
+    def link_mask(self): return 0
+    def update_links(self): return None
     def empty(self): return True  # Used to tell if a room object is empty
     def get_linked_room(self, direction): return None
     def setpos(self, x, y=None): return self
@@ -0,0 +1,335 @@
+"""
+Saves the map to a compact binary file, which can be loaded lazily with mmap
+
+File layout (little-endian):
+    header
+    chunk records - CHUNK_SIZE * CHUNK_SIZE cells each, see CELL
+    chunk index - (key, offset) pairs sorted by level and then key, searched with a binary search
+    string table - offsets followed by utf-8 text, room names and descriptions are stored once each
+    palette - (r, g, b) colours
+    explored rooms - (level, name, x, y) for every explored room, used for pathfinding
+    components - the number of rooms in each connected component, see connectivity.py
+    levels - the part of the chunk index that belongs to each level
+"""
+
+import mmap
+import os
+import struct
+from typing import Optional, Tuple, List, Dict
+import numpy as np
+from chunk import CHUNK_SIZE, EMPTY, ROOM, chunk_positions, both_ways
+import worldgen
+
+MAGIC = b'AGSV'
+VERSION = 4
+
+# magic, version, chunk size, seed, player x, y and level, counts of chunks, strings, colours, explored rooms,
+# components and levels, then the offsets of the index, string table, palette, explored rooms, components and levels
+HEADER = struct.Struct('<4sHHqiiiIIIIIIQQQQQQ')
+
+# item is the index of the item's name in the string table plus one, 0 for no item
+# component is the index of the connected component the room is in
+CELL = np.dtype([('kind', 'u1'), ('links', 'u1'), ('flags', 'u1'), ('color', '<u4'),
+                 ('name', '<u4'), ('description', '<u4'), ('item', '<u4'), ('component', '<u4')])
+INDEX = np.dtype([('key', '<i8'), ('offset', '<u8')])
+EXPLORED = np.dtype([('level', '<i4'), ('name', '<u4'), ('x', '<i4'), ('y', '<i4')])
+INDEX_EMPTY = np.zeros(0, INDEX)
+LEVELS = np.dtype([('level', '<i4'), ('start', '<u4'), ('count', '<u4')])
+
+# bits of CELL.flags
+F_EXPLORED = 1
+F_REVEALED = 2
+
+
+def pack_key(key: Tuple[int, int]) -> int:
+    return (key[0] << 32) | (key[1] & 0xFFFFFFFF)
+
+
+class SaveFile:
+    """
+    A save file opened with mmap, nothing is read until it is needed so opening it takes the same time
+    no matter how big the map is
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file can't be mapped
+            self.file.close()
+            raise ValueError('the file is empty')
+
+        try:
+            (magic, version, chunk_size, self.seed, x, y, self.player_level, self.n_chunks, self.n_strings,
+             self.n_colors, self.n_explored, self.n_components, n_levels, index_offset, strings_offset,
+             palette_offset, explored_offset, components_offset, levels_offset) = HEADER.unpack_from(self.data, 0)
+        except struct.error:
+            self.close()
+            raise ValueError('the file is too short to be a save file')
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('not a save file')
+        if version != VERSION or chunk_size != CHUNK_SIZE:
+            self.close()
+            raise ValueError('it was saved by version %d of the game, this version reads version %d'
+                             % (version, VERSION))
+
+        self.player_pos = (x, y)
+        self.index = np.frombuffer(self.data, INDEX, self.n_chunks, index_offset)
+        self.string_offsets = np.frombuffer(self.data, '<u8', self.n_strings + 1, strings_offset)
+        self.strings_start = strings_offset + (self.n_strings + 1) * 8
+        self.palette = np.frombuffer(self.data, 'u1', self.n_colors * 3, palette_offset).reshape(-1, 3)
+        self.explored_offset = explored_offset
+        self.components = np.frombuffer(self.data, '<u4', self.n_components, components_offset)
+        # the chunk index of each level
+        self.level_index = {int(level): self.index[start:start + count] for level, start, count
+                            in np.frombuffer(self.data, LEVELS, n_levels, levels_offset)}
+        self.cache: Dict[int, str] = {}
+
+    # the cells of a chunk, or None if it isn't in the file
+    def chunk(self, key: Tuple[int, int], level: int = 0) -> Optional[np.ndarray]:
+        index = None if self.data is None else self.level_index.get(level)
+        if index is None:
+            return None
+        packed = pack_key(key)
+        i = int(np.searchsorted(index['key'], packed))
+        if i >= len(index) or index['key'][i] != packed:
+            return None
+        return np.frombuffer(self.data, CELL, CHUNK_SIZE * CHUNK_SIZE, int(index['offset'][i]))
+
+    def keys(self, level: int = 0):
+        for packed in self.level_index.get(level, INDEX_EMPTY)['key']:
+            packed = int(packed)
+            yield packed >> 32, ((packed & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+
+    def levels(self) -> List[int]:
+        return list(self.level_index)
+
+    def string(self, i: int) -> str:
+        if i not in self.cache:
+            # numpy 1.x turns uint64 + int into a float, so the offsets are made ints first
+            start, end = int(self.string_offsets[i]), int(self.string_offsets[i+1])
+            self.cache[i] = self.data[self.strings_start + start:self.strings_start + end].decode('utf-8')
+        return self.cache[i]
+
+    def color(self, i: int) -> Tuple[int, int, int]:
+        r, g, b = self.palette[i]
+        return int(r), int(g), int(b)
+
+    # the explored rooms of a level as (name, x, y), the table is sorted by level
+    def explored(self, level: int = 0) -> np.ndarray:
+        explored = np.frombuffer(self.data, EXPLORED, self.n_explored, self.explored_offset)
+        start, end = np.searchsorted(explored['level'], [level, level + 1])
+        return explored[start:end][['name', 'x', 'y']]
+
+    def close(self):
+        self.index = self.string_offsets = self.palette = self.components = None
+        self.level_index = {}
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+class Interner:
+    """
+    Gives each different value an index, used for the string table and palette
+    """
+
+    def __init__(self, values=()):
+        self.values = []
+        self.indices = {}
+        for value in values:
+            self.add(value)
+
+    def add(self, value) -> int:
+        if value not in self.indices:
+            self.indices[value] = len(self.values)
+            self.values.append(value)
+        return self.indices[value]
+
+
+def encode_chunk(chunk, strings: Interner, palette: Interner) -> np.ndarray:
+    cells = np.zeros(CHUNK_SIZE * CHUNK_SIZE, CELL)
+    for i, room in enumerate(chunk.cells):
+        if room is None:
+            continue
+        if room.empty():
+            cells['kind'][i] = EMPTY
+            continue
+        ly, lx = divmod(i, CHUNK_SIZE)
+        cells[i] = (ROOM, room.link_mask(),
+                    (F_EXPLORED if room.explored() else 0) | (F_REVEALED if chunk.revealed[ly, lx] else 0),
+                    palette.add(tuple(room.color)[:3]), strings.add(room.name), strings.add(room.description),
+                    0 if room.item is None else strings.add(room.item.name) + 1, 0)
+    return cells
+
+
+# the cells of a chunk that the pager dropped, generated again without creating its rooms
+# dropped chunks haven't been changed, so only the links inside the chunk need making consistent, the ones along
+# the edges and the revealed rooms are worked out again from the neighbouring chunks when it is loaded
+def encode_generated(map_obj, key: Tuple[int, int], strings: Interner, palette: Interner) -> np.ndarray:
+    cells = np.zeros(CHUNK_SIZE * CHUNK_SIZE, CELL)
+    cells['kind'] = EMPTY
+    for i, cell in enumerate(worldgen.generate_chunk(map_obj.seed, key, map_obj.room_chance, level=map_obj.level)):
+        if cell is not None:
+            name, description, color, links, item = cell
+            cells[i] = (ROOM, links, 0, palette.add(tuple(color)[:3]), strings.add(name), strings.add(description),
+                        0 if item is None else strings.add(item) + 1, 0)
+    links = np.zeros((CHUNK_SIZE + 2, CHUNK_SIZE + 2), np.uint8)
+    links[1:-1, 1:-1] = cells['links'].reshape(CHUNK_SIZE, CHUNK_SIZE)
+    cells['links'] = np.where(cells['kind'] == ROOM, both_ways(links).ravel(), 0)
+    return cells
+
+
+# change the string and colour indices of stored cells to the ones in a new file
+def remap_chunk(cells: np.ndarray, string, color, strings: Interner, palette: Interner) -> np.ndarray:
+    cells = cells.copy()
+    for i in np.nonzero(cells['kind'] == ROOM)[0]:
+        cells['name'][i] = strings.add(string(cells['name'][i]))
+        cells['description'][i] = strings.add(string(cells['description'][i]))
+        cells['color'][i] = palette.add(color(cells['color'][i]))
+        if cells['item'][i]:
+            cells['item'][i] = strings.add(string(cells['item'][i] - 1)) + 1
+    return cells
+
+
+# give each room the index of its connected component in the new file
+# roots holds the level and root of each component, for the map's current level
+def number_components(map_obj, key: Tuple[int, int], cells: np.ndarray, roots: Interner):
+    find = map_obj.connectivity.find
+    for i, pos in enumerate(chunk_positions(key)):
+        if cells['kind'][i] == ROOM:
+            cells['component'][i] = roots.add((map_obj.level, find(map_obj.component_node(pos))))
+
+
+# cells copied from the old file keep their components, only the indices change
+def renumber_components(map_obj, cells: np.ndarray, roots: Interner):
+    find = map_obj.connectivity.find
+    rooms = cells['kind'] == ROOM
+    old, inverse = np.unique(cells['component'][rooms], return_inverse=True)
+    new = np.array([roots.add((map_obj.level, find(map_obj.saved_component(int(i))))) for i in old], '<u4')
+    cells['component'][rooms] = new[inverse]
+
+
+# the chunk records and explored rooms of the map's current level
+def save_level(map_obj, old: Optional[SaveFile], strings: Interner, palette: Interner, roots: Interner):
+    map_obj.reconcile_links()
+
+    records: List[Tuple[int, np.ndarray]] = []
+    for chunk in map_obj.map:
+        cells = encode_chunk(chunk, strings, palette)
+        number_components(map_obj, chunk.key, cells, roots)
+        records.append((pack_key(chunk.key), cells))
+    stored = set()
+    for key, cells, string, color in map_obj.stored_chunks():
+        stored.add(key)
+        if old is not None and string == old.string:  # the old string table and palette are kept, so copy it as it is
+            cells = cells.copy()
+            renumber_components(map_obj, cells, roots)
+        else:
+            cells = remap_chunk(cells, string, color, strings, palette)
+            number_components(map_obj, key, cells, roots)
+        records.append((pack_key(key), cells))
+    # chunks dropped by the pager aren't stored anywhere, so they are generated again to be saved
+    for key in map_obj.generated:
+        if key not in map_obj.map.chunks and key not in stored:
+            cells = encode_generated(map_obj, key, strings, palette)
+            number_components(map_obj, key, cells, roots)
+            records.append((pack_key(key), cells))
+    records.sort(key=lambda r: r[0])
+
+    explored = [(map_obj.level, strings.add(name), x, y) for name, positions in map_obj.explored_rooms().items()
+                for x, y in sorted(positions)]
+    return records, explored
+
+
+# write the whole map to a file, including chunks that are only stored on disk
+def save_map(map_obj, path: str, player_pos: Tuple[int, int]):
+    old: Optional[SaveFile] = map_obj.save_file
+    strings = Interner(old.string(i) for i in range(old.n_strings)) if old else Interner()
+    palette = Interner(old.color(i) for i in range(old.n_colors)) if old else Interner()
+
+    # each level is saved in turn, then the player's level is made current again
+    player_level = map_obj.level
+    roots = Interner()
+    records: List[Tuple[int, np.ndarray]] = []
+    explored = []
+    sizes = []
+    levels = np.zeros(len(map_obj.level_numbers()), LEVELS)
+    for i, level in enumerate(map_obj.level_numbers()):
+        map_obj.use_level(level)
+        level_records, level_explored = save_level(map_obj, old, strings, palette, roots)
+        levels[i] = (level, len(records), len(level_records))
+        records.extend(level_records)
+        explored.extend(level_explored)
+        sizes.extend(map_obj.connectivity.component_size(root) for _, root in roots.values[len(sizes):])
+    map_obj.use_level(player_level)
+    components = np.array(sizes, '<u4')
+    explored = np.array(explored, EXPLORED)
+
+    encoded = [s.encode('utf-8') for s in strings.values]
+    string_offsets = np.zeros(len(encoded) + 1, '<u8')
+    string_offsets[1:] = np.cumsum([len(s) for s in encoded])
+
+    index = np.zeros(len(records), INDEX)
+    offset = HEADER.size
+    for i, (key, cells) in enumerate(records):
+        index[i] = (key, offset)
+        offset += cells.nbytes
+    index_offset = offset
+    strings_offset = index_offset + index.nbytes
+    palette_offset = strings_offset + string_offsets.nbytes + int(string_offsets[-1])
+    explored_offset = palette_offset + len(palette.values) * 3
+    components_offset = explored_offset + explored.nbytes
+    levels_offset = components_offset + components.nbytes
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, CHUNK_SIZE, map_obj.seed, player_pos[0], player_pos[1], player_level,
+                            len(records), len(encoded), len(palette.values), len(explored), len(components),
+                            len(levels), index_offset, strings_offset, palette_offset, explored_offset,
+                            components_offset, levels_offset))
+        for key, cells in records:
+            f.write(cells.tobytes())
+        f.write(index.tobytes())
+        f.write(string_offsets.tobytes())
+        f.write(b''.join(encoded))
+        f.write(np.array(palette.values, 'u1').tobytes())
+        f.write(explored.tobytes())
+        f.write(components.tobytes())
+        f.write(levels.tobytes())
+
+    # the old file has to be closed before it can be replaced
+    if old:
+        old.close()
+    os.replace(path + '.tmp', path)
+    map_obj.save_file = SaveFile(path)
+    # the components in the new file are the ones in each level's connectivity, so they don't need adding again
+    for level in map_obj.level_numbers():
+        map_obj.use_level(level)
+        map_obj.saved_components = {i: root for i, (root_level, root) in enumerate(roots.values) if root_level == level}
+        for root in map_obj.saved_components.values():
+            map_obj.connectivity.add(root)
+    map_obj.use_level(player_level)
+
+
+# a name that isn't taken yet for a copy of the file at path, path.bak, path.1.bak and so on
+def backup_path(path: str) -> str:
+    backup, i = path + '.bak', 0
+    while os.path.exists(backup):
+        i += 1
+        backup = '%s.%d.bak' % (path, i)
+    return backup
+
+
+# raises ValueError if the file isn't a save file that this version can read
+def load_map(path: str):
+    from map import Map
+    save_file = SaveFile(path)
+    try:
+        return Map(save_file=save_file)
+    except (IndexError, KeyError, UnicodeDecodeError, struct.error) as e:
+        save_file.close()
+        raise ValueError('the file is damaged (' + type(e).__name__ + ')')
@@ -0,0 +1,45 @@
+from sys import maxsize
+from time import perf_counter
+from typing import Set, Tuple
+from chunk import chunk_key
+from coroutine import Coroutine, Generation
+
+
+class GenerationScheduler:
+    """
+    Spreads map generation over many frames instead of generating everything at once
+    Map.generate() only creates the chunks right next to the player and queues the rest, which are then
+    generated by a Coroutine with a time limit for each frame
+    """
+
+    def __init__(self,
+                 map_obj,
+                 budget: float = 4,  # milliseconds of generation per frame
+                 distance: int = 20,  # radius that Map.generate() should cover
+                 immediate: int = 2):  # radius that is still generated straight away
+        self.map = map_obj
+        self.map.scheduler = self
+        self.map.generate_distance = distance
+        self.budget = budget
+        self.immediate = immediate
+        self.queue: Set[Tuple[int, int]] = set()
+
+    def add(self, keys):
+        self.queue.update(keys)
+        if self.queue and not Coroutine.running(Generation):
+            Coroutine(self.step, maxsize, singular_type=Generation, delay=0)
+
+    # called once per frame by the Coroutine, generates the closest chunks until the budget is used up
+    def step(self, i: int, end: int):
+        start = perf_counter()
+        px, py = chunk_key(*self.map.curr_room.pos)
+        order = sorted(self.queue, key=lambda k: max(abs(k[0] - px), abs(k[1] - py)), reverse=True)
+
+        while order and (perf_counter() - start) * 1000 < self.budget:
+            key = order.pop()
+            self.queue.discard(key)
+            if key not in self.map.generated:
+                self.map.generate_chunk(key)
+
+        self.map.reconcile_links()
+        return -1 if not self.queue else None
@@ -0,0 +1,417 @@
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from random import Random
+from typing import Optional
+import biome
+import gamecontroller
+import worldgen
+from chunk import CHUNK_SIZE, chunk_key
+from connectivity import UnionFind
+from map import Map
+from pager import ChunkPager
+from pathfinding import PathFinder
+from player import Player
+from room import sides
+from save import save_map, load_map, HEADER
+
+
+class BiomeTest(unittest.TestCase):
+
+    # the batched noise matches working out each cell on its own
+    def test_area_matches_value(self):
+        f = biome.NoiseField(1, 8)
+        a = f.area(-5, 3, 20, 10)
+        for j in range(10):
+            for i in range(20):
+                self.assertAlmostEqual(a[j, i], f.value(-5 + i, 3 + j), places=12)
+
+    def test_deterministic_and_bounded(self):
+        a = biome.NoiseField(7, 40).area(-100, -100, 200, 200)
+        self.assertTrue((a == biome.NoiseField(7, 40).area(-100, -100, 200, 200)).all())
+        self.assertFalse((a == biome.NoiseField(8, 40).area(-100, -100, 200, 200)).all())
+        self.assertLess(abs(a).max(), 0.75)
+
+
+class WorldgenTest(unittest.TestCase):
+    keys = [(x, y) for y in range(-2, 3) for x in range(-2, 3)]
+
+    # chunks only depend on the seed, the level and the key, not on the chunks generated before them
+    def test_any_order(self):
+        for level in (0, 1, -1):
+            in_order = [worldgen.generate_chunk(11, key, level=level) for key in self.keys]
+            shuffled = self.keys[:]
+            Random(level).shuffle(shuffled)
+            cells = {key: worldgen.generate_chunk(11, key, level=level) for key in shuffled}
+            self.assertEqual([cells[key] for key in self.keys], in_order)
+        self.assertNotEqual(worldgen.generate_chunk(11, (0, 0)), worldgen.generate_chunk(12, (0, 0)))
+
+    # the same chunks as the pregenerator's worker processes make
+    def test_process_pool(self):
+        with ProcessPoolExecutor(2) as pool:
+            futures = [pool.submit(worldgen.generate_chunk, 11, key, 0.6, level=1) for key in reversed(self.keys)]
+            pooled = [future.result() for future in reversed(futures)]
+        self.assertEqual(pooled, [worldgen.generate_chunk(11, key, 0.6, level=1) for key in self.keys])
+
+
+# move the player to rooms it hasn't explored yet where it can, so the map keeps growing
+# a room reached by changing level on purpose may have no links, then the player stays there
+def explore(player: Player, rng: Random, moves: int):
+    for _ in range(moves):
+        rooms = [(d, player.room.get_linked_room(d)) for d in 'nesw']
+        rooms = [(d, room) for d, room in rooms if room is not None and not room.empty()]
+        if not rooms:
+            return
+        new = [d for d, room in rooms if not room.explored()]
+        player.move(rng.choice(new or [d for d, _ in rooms]))
+
+
+# a map with some of three levels explored, the player ends up back on level 0
+def explored_map(seed: int = 3) -> Map:
+    m = Map(seed)
+    player = Player(m)
+    rng = Random(seed)
+    explore(player, rng, 80)
+    for level in (1, 2, 0):
+        player.room = m.change_level(level, m.curr_room.pos)
+        explore(player, rng, 40)
+    return m
+
+
+class LinksTest(unittest.TestCase):
+
+    # the map checks itself after every reconcile_links() while the player walks across chunks and levels,
+    # with chunks being paged out and loaded again on the way
+    def test_validate_while_exploring(self):
+        m = Map(5)
+        m.validate = True
+        m.reconcile_links()
+        player = Player(m)
+        pager = ChunkPager(m, 4, keep_distance=1)
+        rng = Random(5)
+        levels = {0}
+        for level in (1, 2, 1, 0):
+            player.room = m.change_level(level, m.curr_room.pos)
+            levels.add(level)
+            for _ in range(150):
+                explore(player, rng, 1)
+                pager.poll()
+            m.reconcile_links()
+            m.validate_links()
+        self.assertEqual(set(m.level_numbers()), levels)
+        self.assertGreater(pager.evictions, 0)
+        pager.close()
+
+    def test_validate_finds_broken_link(self):
+        m = Map(5)
+        m.reconcile_links()
+        m.validate_links()
+        room = next(room for room in m.map.chunks[(0, 0)].cells if room is not None and not room.empty()
+                    and any(room.has_link(d) and not room.get_linked_room(d).empty() for d in 'nesw'))
+        room.set_link_mask(0)
+        self.assertRaises(AssertionError, m.validate_links)
+
+
+# the rooms of the chunks in memory, in order
+def rooms(m: Map):
+    return [pos for key in sorted(m.map.chunks) for pos, room in zip(m.map.chunks[key].positions(),
+                                                                   m.map.chunks[key].cells)
+            if room is not None and not room.empty()]
+
+
+class ConnectivityTest(unittest.TestCase):
+
+    def test_union_find(self):
+        u = UnionFind()
+        u.add('saved', 10)
+        u.union(1, 2)
+        u.union(3, 'saved')
+        self.assertEqual((u.component_size(1), u.component_size(3), u.component_size(4)), (2, 11, 1))
+        self.assertTrue(u.union(2, 3))
+        self.assertFalse(u.union(1, 'saved'))
+        self.assertTrue(u.connected(1, 'saved'))
+        self.assertEqual(u.component_size(2), 13)
+
+    # linking two rooms joins their components
+    def test_link_joins_components(self):
+        m = Map(3)
+        m.reconcile_links()
+        a, d, b = next((pos, d, (pos[0] + dx, pos[1] + dy)) for pos in rooms(m) for d, (dx, dy) in sides.items()
+                       if not m.get(pos).has_link(d) and m.get(pos).get_linked_room(d) is None
+                       and m.get(pos).get_adj_room(d) is not None and not m.get(pos).get_adj_room(d).empty()
+                       and not m.reachable(pos, (pos[0] + dx, pos[1] + dy)))
+        sizes = m.component_size(a), m.component_size(b)
+        m.get(a).link_bool(d)
+        m.room_changed(m.get(a))
+        m.reconcile_links()
+        self.assertTrue(m.reachable(a, b))
+        self.assertEqual(m.component_size(a), sum(sizes))
+        self.assertEqual(m.component_size(b), sum(sizes))
+
+    # paging chunks out (which replaces their rooms with one item per component, see Map.trim_connectivity())
+    # and loading them again gives the same components as keeping everything in memory
+    # the maps are walked one after the other, as rooms use the last map that was created (see Room.map_obj)
+    def test_page_out_and_in(self):
+        def walk(m: Map, pager: Optional[ChunkPager] = None):
+            player = Player(m)
+            rng = Random(2)
+            for _ in range(1000):
+                explore(player, rng, 1)
+                if pager is None:
+                    m.reconcile_links()
+                else:
+                    pager.poll()
+            return player.room.pos
+
+        def components(m: Map):
+            return [(m.component_size(pos), m.reachable(pos, end)) for pos in positions]
+
+        everything = Map(21)
+        end = walk(everything)
+        positions = rooms(everything)
+        expected = components(everything)
+
+        paged = Map(21)
+        pager = ChunkPager(paged, 3, keep_distance=1)
+        self.assertEqual(walk(paged, pager), end)
+        self.assertTrue(paged.paged_components)
+        self.assertLess(len(paged.connectivity), len(everything.connectivity))
+        self.assertEqual(components(paged), expected)
+        for key in sorted(everything.map.chunks):
+            paged.map.chunks.get(key) or paged.fault_chunk(key)
+        paged.reconcile_links()
+        self.assertEqual(components(paged), expected)
+        pager.close()
+
+    # a new chunk that can't be reached gets a route to the first room
+    def test_ensure_route(self):
+        m = Map(1)
+        m.reconcile_links()
+        m.generate_chunk((1, 0))
+        m.new_chunks.discard((1, 0))
+        m.reconcile_links()
+        new_rooms = [pos for pos in rooms(m) if chunk_key(*pos) == (1, 0)]
+        self.assertFalse(any(m.reachable(pos, m.first_room.pos) for pos in new_rooms))
+
+        m.ensure_route((1, 0))
+        m.reconcile_links()
+        self.assertTrue(any(m.reachable(pos, m.first_room.pos) for pos in new_rooms))
+        self.assertIn((1, 0), m.touched)
+        m.validate_links()
+
+
+class PagerTest(unittest.TestCase):
+
+    def walk(self, m: Map, pager: ChunkPager, moves: int, check=None):
+        player = Player(m)
+        rng = Random(2)
+        for _ in range(moves):
+            explore(player, rng, 1)
+            pager.poll()
+            if check is not None:
+                check()
+        return player
+
+    def test_budget(self):
+        m = Map(4)
+        pager = ChunkPager(m, 12, keep_distance=1)
+        self.walk(m, pager, 600, lambda: self.assertLessEqual(pager.resident(), 12))
+        self.assertGreater(pager.evictions, 0)
+        self.assertGreater(pager.written, 0)
+        pager.close()
+
+    # a hit is entering a chunk that was in memory, entering one that had to be loaded is only a fault
+    def test_hits_and_faults(self):
+        m = Map(4)
+        pager = ChunkPager(m, 3)
+        pager.keep_distance = 0  # so the chunk the player goes into next often has to be loaded
+        player = Player(m)
+        rng = Random(2)
+        entered = missed = 0
+        key = chunk_key(*player.room.pos)
+        for _ in range(600):
+            resident = set(m.map.chunks)
+            explore(player, rng, 1)
+            if chunk_key(*player.room.pos) != key:
+                key = chunk_key(*player.room.pos)
+                entered += 1
+                missed += key not in resident
+            pager.poll()
+        self.assertGreater(missed, 10)
+        self.assertLess(missed, entered - 10)
+        self.assertEqual(pager.hits, entered - missed)
+        self.assertGreaterEqual(pager.faults, missed)
+        pager.close()
+
+    # a chunk written to the swap file comes back the same
+    def test_swap_round_trip(self):
+        m = Map(4)
+        pager = ChunkPager(m, 1000)
+        player = self.walk(m, pager, 300)
+        m.reconcile_links()
+        key = next(key for key in sorted(m.touched) if key in m.map.chunks and key != chunk_key(*player.room.pos)
+                   and m.map.chunks[key].explored.any())
+
+        def contents():
+            chunk = m.map.chunks[key]
+            rooms = [None if room is None else (room.empty(), room.name, room.description, tuple(room.color),
+                                                 room.link_mask(), room.explored(),
+                                                 room.item and room.item.name) for room in chunk.cells]
+            return rooms, [getattr(chunk, layer).tolist() for layer in chunk.layers]
+
+        before = contents()
+        pager.write(m.map.chunks[key])
+        m.unload_chunk(key)
+        self.assertNotIn(key, m.map.chunks)
+        self.assertIsNotNone(m.fault_chunk(key))
+        m.reconcile_links()
+        self.assertEqual(contents(), before)
+        pager.close()
+
+
+class PathfindingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.map = Map(6)
+        self.player = Player(self.map)
+        explore(self.player, Random(6), 300)
+        self.finder = PathFinder(self.map)
+
+    # following a path only goes through linked, explored rooms and ends at the goal
+    def test_path_follows_links(self):
+        start = self.player.room.pos
+        goals = sorted(set().union(*self.map.explored_rooms().values()))
+        for goal in goals[::len(goals) // 20]:
+            path = self.finder.path(start, goal)
+            self.assertIsNotNone(path, goal)
+            pos = start
+            for d in path:
+                self.assertTrue(self.map.get(pos).has_link(d), (goal, pos, d))
+                pos = (pos[0] + sides[d][0], pos[1] + sides[d][1])
+                self.assertTrue(self.map.get(pos).explored(), (goal, pos))
+            self.assertEqual(pos, goal)
+
+    def test_start_is_goal(self):
+        room = self.player.room
+        self.assertEqual(self.finder.path(room.pos, room.pos), [])
+        self.assertEqual(self.finder.find(room.pos, room.name), room.pos)
+
+    def test_unknown_name(self):
+        self.assertIsNone(self.finder.find(self.player.room.pos, 'no such room'))
+        directory = tempfile.mkdtemp()
+        path, gamecontroller.SAVE_PATH = gamecontroller.SAVE_PATH, os.path.join(directory, 'world.sav')
+        try:
+            game = gamecontroller.GameController(None)
+            room = game.player.room
+            self.assertEqual(game.goto('no such room'), [])
+            self.assertIs(game.player.room, room)
+            self.assertTrue(game.event_queue[-1].get_value('text').startswith('You don\'t know the way to "no such room"'))
+            game.pager.close()
+        finally:
+            gamecontroller.SAVE_PATH = path
+            shutil.rmtree(directory)
+
+    # rooms in chunks that have been paged out are still found without reading the swap file
+    def test_paged_out_rooms(self):
+        m = Map(4)
+        pager = ChunkPager(m, 4, keep_distance=1)
+        PagerTest.walk(self, m, pager, 600)
+        paged = {pos for positions in m.explored_rooms().values() for pos in positions
+                 if chunk_key(*pos) not in m.map.chunks}
+        self.assertTrue(paged)
+
+        def load(key):
+            raise AssertionError('read the swap file')
+        pager.load = load
+        for name, positions in m.explored_rooms().items():
+            if positions <= paged:
+                self.assertIn(PathFinder(m).find(m.curr_room.pos, name), positions)
+                break
+        else:
+            self.fail('no room that is only in paged out chunks')
+        pager.close()
+
+
+class SaveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'world.sav')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        m = explored_map()
+        save_map(m, self.path, m.curr_room.pos)
+        loaded = load_map(self.path)
+        self.assertEqual(loaded.level_numbers(), m.level_numbers())
+        self.assertEqual(loaded.curr_room.pos, m.curr_room.pos)
+
+        for level in m.level_numbers():
+            m.use_level(level)
+            loaded.use_level(level)
+            self.assertEqual(loaded.explored_rooms(), m.explored_rooms())
+            start = None
+            for key in sorted(m.generated):
+                x, y = key[0] * CHUNK_SIZE, key[1] * CHUNK_SIZE
+                for layer in ('kind', 'links', 'explored'):
+                    self.assertTrue((loaded.map.window(layer, x, y, CHUNK_SIZE, CHUNK_SIZE, fault=True) ==
+                                     m.map.window(layer, x, y, CHUNK_SIZE, CHUNK_SIZE)).all(), (level, key, layer))
+                for pos, room in zip(m.map.chunks[key].positions(), m.map.chunks[key].cells):
+                    if room is not None and not room.empty():
+                        start = start or pos
+                        self.assertEqual(loaded.get(pos).name, room.name)
+                        self.assertEqual(loaded.component_size(pos), m.component_size(pos), (level, pos))
+                        self.assertEqual(loaded.reachable(pos, start), m.reachable(pos, start), (level, pos))
+        loaded.save_file.close()
+        m.save_file.close()
+
+    # saving a map that was loaded copies the chunks that weren't loaded again from the old file
+    def test_save_loaded_map(self):
+        m = explored_map()
+        save_map(m, self.path, m.curr_room.pos)
+        loaded = load_map(self.path)
+        save_map(loaded, self.path, loaded.curr_room.pos)
+        again = load_map(self.path)
+        self.assertEqual(again.level_numbers(), m.level_numbers())
+        for level in m.level_numbers():
+            m.use_level(level)
+            again.use_level(level)
+            self.assertEqual(again.explored_rooms(), m.explored_rooms())
+            for pos in set().union(*m.explored_rooms().values()):
+                self.assertEqual(again.component_size(pos), m.component_size(pos), (level, pos))
+        again.save_file.close()
+        loaded.save_file.close()
+        m.save_file.close()
+
+    # a save from another version isn't loaded, and the game moves it aside instead of overwriting it
+    def test_other_version(self):
+        m = explored_map()
+        save_map(m, self.path, m.curr_room.pos)
+        m.save_file.close()
+        with open(self.path, 'r+b') as f:
+            header = list(HEADER.unpack(f.read(HEADER.size)))
+            header[1] -= 1
+            f.seek(0)
+            f.write(HEADER.pack(*header))
+        self.assertRaises(ValueError, load_map, self.path)
+
+        path, gamecontroller.SAVE_PATH = gamecontroller.SAVE_PATH, self.path
+        try:
+            game = gamecontroller.GameController(None)
+            self.assertIn('version', game.load_error)
+            self.assertFalse(os.path.exists(self.path))
+            self.assertTrue(os.path.exists(self.path + '.bak'))
+            game.quit()
+            game.map.save_file.close()
+            self.assertTrue(os.path.exists(self.path + '.bak'))
+            load_map(self.path).save_file.close()
+        finally:
+            gamecontroller.SAVE_PATH = path
+
+
+if __name__ == "__main__":
+    unittest.main()
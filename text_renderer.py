@@ -41,6 +41,7 @@ class TextRenderer:
         self.antialias = antialias
         self.size = (dimensions[0] - inner_padding * 2,
                      dimensions[1] - inner_padding * 2)
+        self.dirty = True  # set when the image is drawn again, see compositor.py
 
         # create surfaces
         self._image = pygame.Surface((dimensions[0] + padding * 2,
@@ -76,6 +77,7 @@ class TextRenderer:
 
         self.surface.blit(textsurf, textpos)
         self._image.blit(self.surface, (self.total_padding, self.total_padding))
+        self.dirty = True
 
     def draw(self, offset=(0, 0), scale=1, end_text: str = ''):
         scale = self.scale * scale
@@ -90,6 +92,7 @@ class TextRenderer:
             self.surface.blit(surf, pos(i))
 
         self._image.blit(self.surface, (self.total_padding, self.total_padding))
+        self.dirty = True
 
     def format_text(self, text):
         line_start = 0
@@ -114,6 +117,7 @@ class TextRenderer:
 
     def draw_window(self, offset=(0, 0)):
         self._image.blit(self.surface, (self.total_padding, self.total_padding))
+        self.dirty = True
 
     def clear_text(self):
         self.text = ''
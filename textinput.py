@@ -71,6 +71,8 @@ class TextInput:
         # Text-surface will be created during the first update call:
         self.surface = pygame.Surface((1, 1))
         self.surface.set_alpha(0)
+        self.rendered = None  # what the surface shows, see update()
+        self.dirty = True  # set when the surface is rendered again, see compositor.py
 
         # Vars to make keydowns repeat after user pressed a key for some time:
         self.keyrepeat_counters = {}  # {event.key: (counter_int, event.unicode)} (look for "***")
@@ -161,20 +163,26 @@ class TextInput:
                 event_key, event_unicode = key, self.keyrepeat_counters[key][1]
                 pygame.event.post(pygame.event.Event(pl.KEYDOWN, key=event_key, unicode=event_unicode))
 
-        # Re-render text surface:
-        string = self.input_string
-        if self.password:
-            string = "*" * len(self.input_string)
-        string = self.front_text + string + " "
-        self.surface = self.font_object.render(string, self.antialias, self.text_color)
-
         # Update self.cursor_visible
         self.cursor_ms_counter += self.clock.get_time()
         if self.cursor_ms_counter >= self.cursor_switch_ms:
             self.cursor_ms_counter %= self.cursor_switch_ms
             self.cursor_visible = not self.cursor_visible
 
-        if self.cursor_visible and self.show_cursor:
+        # Re-render text surface, only if it would look different, so the screen isn't updated when nothing changed:
+        string = self.input_string
+        if self.password:
+            string = "*" * len(self.input_string)
+        string = self.front_text + string + " "
+        cursor = self.cursor_visible and self.show_cursor
+        if (string, cursor, self.cursor_position, self.text_color) == self.rendered:
+            self.clock.tick()
+            return False
+        self.rendered = (string, cursor, self.cursor_position, self.text_color)
+        self.surface = self.font_object.render(string, self.antialias, self.text_color)
+        self.dirty = True
+
+        if cursor:
             endstring = ""
             if self.horizontal_cursor:
                 endstring = " "
@@ -192,6 +200,15 @@ class TextInput:
     def get_surface(self):
         return self.surface
 
+    # milliseconds until update() has something to do without any new events: 0 while a key is held down, as it
+    # repeats, otherwise the time until the cursor blinks, or None if there is no cursor
+    def next_change(self):
+        if self.keyrepeat_counters:
+            return 0
+        if not self.show_cursor:
+            return None
+        return max(0, self.cursor_switch_ms - self.cursor_ms_counter)
+
     def get_text(self):
         return self.input_string
 
@@ -203,6 +220,7 @@ class TextInput:
 
     def set_cursor_color(self, color):
         self.cursor_surface.fill(color)
+        self.rendered = None
 
     def clear_text(self):
         self.input_string = ""
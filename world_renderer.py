@@ -0,0 +1,184 @@
+"""
+Draws the map from tiles that are kept between frames, for the map view and the minimap
+Tiles are drawn once and afterwards only the cells whose appearance changed are drawn again, so the cost of a move
+depends on how many rooms it reveals rather than on the size of the view. A Camera puts together the tiles that can
+be seen from any point of the map, including points between rooms, so the view can pan smoothly
+"""
+
+from collections import OrderedDict
+from typing import Dict, Tuple, Optional, Set, Union
+import numpy as np
+import pygame
+from pygame.math import Vector2
+from chunk import CHUNK_SIZE, ROOM, link_bits, stair_bits, chunk_key
+
+# bits of the appearance of a cell, see TileLayer.appearance()
+VISIBLE = 1
+EXPLORED = 2
+PENDING = 4
+CORRIDOR_SHIFT = 3  # bits 3 to 6 are the halves of the corridors leading n, e, s and w
+STAIRS_SHIFT = 3  # the stair bits of the links layer are moved up to bits 7 and 8
+STAIRS = stair_bits['<'] | stair_bits['>']
+
+sides = {'n': (0, -1), 'e': (1, 0), 's': (0, 1), 'w': (-1, 0)}
+
+
+class TileLayer:
+    """
+    The map drawn at one size, as square tiles of tile_cells x tile_cells positions
+    Each tile remembers the versions of the chunk it is in and the chunks next to it (see Chunk.changed()) and the
+    appearance of its cells, so unchanged tiles are just blitted. Tiles are kept for each level, and the least
+    recently used are removed when there are more than max_tiles
+    """
+
+    def __init__(self,
+                 renderer,  # the MapRenderer, its sprite cache is used for the rooms
+                 pitch: int,  # pixels from one room to the next
+                 room_size: int,
+                 corridor_width: int,
+                 tile_cells: int = CHUNK_SIZE,  # must divide CHUNK_SIZE
+                 max_tiles: int = 256):
+        self.renderer = renderer
+        self.map = renderer.map
+        self.pitch = pitch
+        self.room_size = room_size
+        self.margin = (pitch - room_size) // 2
+        self.tile_cells = tile_cells
+        self.max_tiles = max_tiles
+        # [surface or None, appearance of each cell, state it was drawn for] by (level, tx, ty)
+        self.tiles: Dict[Tuple[int, int, int], list] = OrderedDict()
+        self.cells_drawn = 0
+
+        # the half of each corridor that is inside a cell, relative to the corner of the cell
+        m, r, w = self.margin, room_size, corridor_width
+        mid = (pitch - w) // 2
+        self.corridors = [pygame.Rect(mid, 0, w, m), pygame.Rect(m + r, mid, pitch - m - r, w),
+                          pygame.Rect(mid, m + r, w, pitch - m - r), pygame.Rect(0, mid, m, w)]
+
+    # the tile, brought up to date, or None if nothing in it can be seen
+    def tile(self, key: Tuple[int, int], pending: Set[Tuple[int, int]]) -> Optional[pygame.Surface]:
+        level_key = (self.map.level,) + key
+        entry = self.tiles.get(level_key)
+        if entry is not None:
+            self.tiles.move_to_end(level_key)
+
+        chunk = chunk_key(key[0] * self.tile_cells, key[1] * self.tile_cells)
+        state = self.state(chunk, pending)
+        if state is None or (entry is not None and entry[2] == state):
+            return None if entry is None else entry[0]
+
+        cells = self.appearance(key, state)
+        if entry is None:
+            entry = self.tiles[level_key] = [None, np.zeros_like(cells), state]
+            if len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        if entry[0] is None and cells.any():
+            entry[0] = pygame.Surface((self.tile_cells * self.pitch, self.tile_cells * self.pitch))
+            if pygame.display.get_surface() is not None:
+                entry[0] = entry[0].convert()
+            entry[0].fill('black')
+
+        if entry[0] is not None:
+            for y, x in zip(*np.nonzero(cells != entry[1])):
+                self.draw_cell(entry[0], key, int(x), int(y), int(cells[y, x]))
+        entry[1], entry[2] = cells, state
+        return entry[0]
+
+    # what a tile in the chunk is drawn from, 'pending' or 'none' for chunks that haven't been generated, otherwise
+    # the versions of the chunk and the chunks next to it. None if it can't be drawn yet, as the chunk or one of the
+    # chunks next to it has been paged out
+    def state(self, key: Tuple[int, int], pending: Set[Tuple[int, int]]):
+        if key not in self.map.generated:
+            return 'pending' if key in pending else 'none'
+        chunks = self.map.map.chunks
+        versions = []
+        for k in [key] + [(key[0] + dx, key[1] + dy) for dx, dy in sides.values()]:
+            if k in chunks:
+                versions.append(chunks[k].version)
+            elif k in self.map.generated:
+                return None
+            else:
+                versions.append(0)
+        return tuple(versions)
+
+    # the appearance of each cell of a tile as a bit mask, cells are drawn again when it changes
+    def appearance(self, key: Tuple[int, int], state) -> np.ndarray:
+        n = self.tile_cells
+        if state == 'pending':
+            return np.full((n, n), PENDING, np.int32)
+        if state == 'none':
+            return np.zeros((n, n), np.int32)
+
+        x, y, size = key[0] * n - 1, key[1] * n - 1, n + 2
+        room = self.map.map.window('kind', x, y, size, size) == ROOM
+        explored = self.map.map.window('explored', x, y, size, size)
+        links = self.map.map.window('links', x, y, size, size)[1:-1, 1:-1]
+        visible = self.map.map.window('revealed', x, y, size, size)[1:-1, 1:-1]
+        seen = visible & explored[1:-1, 1:-1]
+
+        cells = visible * VISIBLE | seen * EXPLORED
+        for i, (d, (dx, dy)) in enumerate(sides.items()):
+            adj = (slice(1 + dy, n + 1 + dy), slice(1 + dx, n + 1 + dx))
+            corridor = visible & (links & link_bits[d] != 0) & room[adj] & (seen | explored[adj])
+            cells |= corridor.astype(np.int32) << (CORRIDOR_SHIFT + i)
+        cells |= (links & STAIRS).astype(np.int32) * seen << STAIRS_SHIFT
+        return cells.astype(np.int32)
+
+    def draw_cell(self, tile: pygame.Surface, key: Tuple[int, int], x: int, y: int, cell: int):
+        self.cells_drawn += 1
+        left, top = x * self.pitch, y * self.pitch
+        tile.fill('black', (left, top, self.pitch, self.pitch))
+        corner = (left + self.margin, top + self.margin)
+        if cell & PENDING:
+            tile.blit(self.renderer.draw_room(None, self.room_size, color=(25, 25, 25)), corner)
+        if cell & VISIBLE:
+            room = self.map.get(key[0] * self.tile_cells + x, key[1] * self.tile_cells + y)
+            tile.blit(self.renderer.draw_room(room, self.room_size), corner)
+            for i, rect in enumerate(self.corridors):
+                if cell & (1 << (CORRIDOR_SHIFT + i)):
+                    tile.fill('gray', rect.move(left, top))
+
+    def clear(self):
+        self.tiles.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'tiles': len(self.tiles), 'cells_drawn': self.cells_drawn}
+
+
+class Camera:
+    """
+    Shows the tiles of a TileLayer that can be seen from a point of the map
+    The point is in rooms and doesn't have to be a whole number, so the view can be anywhere between two rooms
+    """
+
+    def __init__(self, layer: TileLayer, pos: Tuple[float, float] = (0, 0)):
+        self.layer = layer
+        self.pos = Vector2(pos)  # the point in the centre of the view, the centre of room (x, y) is at (x, y)
+
+    def look_at(self, pos: Union[Tuple[float, float], Vector2]):
+        self.pos = Vector2(pos)
+
+    # fill surf with the view, only the rooms within radius of the point are drawn if radius is given
+    def draw(self, surf: pygame.Surface, radius: Optional[float] = None):
+        surf.fill('black')
+        layer = self.layer
+        p, n = layer.pitch, layer.tile_cells
+        w, h = surf.get_size()
+        # where the corner of position (0, 0) is on surf
+        ox, oy = round(w / 2 - (self.pos.x + 0.5) * p), round(h / 2 - (self.pos.y + 0.5) * p)
+
+        # the positions that can be seen
+        x0, y0, x1, y1 = -ox // p, -oy // p, (w - ox - 1) // p, (h - oy - 1) // p
+        if radius is not None:
+            size = round((radius * 2 + 1) * p)
+            surf.set_clip(pygame.Rect(round(w / 2 - size / 2), round(h / 2 - size / 2), size, size))
+            x0, y0 = max(x0, int(self.pos.x - radius) - 1), max(y0, int(self.pos.y - radius) - 1)
+            x1, y1 = min(x1, int(self.pos.x + radius) + 1), min(y1, int(self.pos.y + radius) + 1)
+
+        pending = layer.map.pending_chunks()
+        for ty in range(y0 // n, y1 // n + 1):
+            for tx in range(x0 // n, x1 // n + 1):
+                tile = layer.tile((tx, ty), pending)
+                if tile is not None:
+                    surf.blit(tile, (ox + tx * n * p, oy + ty * n * p))
+        surf.set_clip(None)
@@ -0,0 +1,78 @@
+"""
+Generates the contents of each chunk of the map, using the room archetypes from archetypes.py
+The biome fields from biome.py change the density, links and colours of the rooms across the map
+The result only depends on the world seed, the level and the chunk coordinates, so chunks can be generated
+in any order (or in other processes) and regenerated identically later
+"""
+
+from random import Random
+from typing import List, Optional, Tuple
+from chunk import CHUNK_SIZE, exit_bits, stair_bits
+import archetypes
+import biome
+
+# see archetypes.RoomData, None for an empty space
+RoomData = Optional[archetypes.RoomData]
+
+
+STAIR_CHANCE = 0.15  # chance of a chunk having stairs down to the next level
+
+
+# each level is generated from its own seed, level 0 uses the world seed
+def level_seed(seed: int, level: int) -> int:
+    return seed if level == 0 else (seed + level * 0x9E3779B1) & 0xFFFFFFFF
+
+
+def chunk_rng(seed: int, key: Tuple[int, int], level: int = 0) -> Random:
+    return Random('%d:%d:%d' % (level_seed(seed, level), key[0], key[1]))
+
+
+# positions (indices into the chunk) of the stairs from a level down to the one below it
+# both levels use this, so the stairs always line up without either level being generated first
+def stairs(seed: int, key: Tuple[int, int], level: int) -> List[int]:
+    rng = Random('stairs:%d:%d:%d:%d' % (seed, level, key[0], key[1]))
+    return [rng.randrange(CHUNK_SIZE * CHUNK_SIZE)] if rng.random() < STAIR_CHANCE else []
+
+
+def generate_chunk(seed: int, key: Tuple[int, int], room_chance: float = 0.6,
+                   link_chance: Optional[float] = None, level: int = 0) -> List[RoomData]:
+    rng = chunk_rng(seed, key, level)
+    table = archetypes.default_table()
+    cells: List[RoomData] = [None] * (CHUNK_SIZE * CHUNK_SIZE)
+
+    field = biome.field(level_seed(seed, level))
+    chances = field.room_chances(key, room_chance)
+    link_scales = field.link_scales(key)
+    warmth = field.warmth(key)
+
+    # decide where the rooms are first, so all the rooms in the chunk can be generated at once
+    rooms = [i for i in range(CHUNK_SIZE * CHUNK_SIZE) if rng.random() <= chances[i]]
+    generated = table.generate(rng, len(rooms), link_chance, [link_scales[i] for i in rooms])
+    for i, (name, description, color, links, item) in zip(rooms, generated):
+        cells[i] = (name, description, tint(color, warmth[i]), links, item)
+
+    # there is always a room at each end of the stairs
+    for bit, stairs_level in ((stair_bits['>'], level), (stair_bits['<'], level - 1)):
+        for i in stairs(seed, key, stairs_level):
+            if cells[i] is None:
+                name, description, color, links, item = table.generate_kind(rng, 'stairwell', links=True)
+                cells[i] = (name, description, tint(color, warmth[i]), links, item)
+            name, description, color, links, item = cells[i]
+            cells[i] = (name, description, color, links | bit, item)
+
+    return cells
+
+
+# warm areas are redder and cold areas are bluer
+def tint(color: Tuple[int, int, int], warmth: float) -> Tuple[int, int, int]:
+    shift = int(warmth * 80)
+    r, g, b = color
+    return min(255, max(0, r + shift)), g, min(255, max(0, b - shift))
+
+
+def mask(links: dict) -> int:
+    return sum(bit for d, bit in exit_bits.items() if links.get(d))
+
+
+def unmask(links: int) -> dict:
+    return {d: bool(links & bit) for d, bit in exit_bits.items()}